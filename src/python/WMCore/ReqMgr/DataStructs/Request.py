@@ -17,13 +17,23 @@ TODO/NOTE:
 """
 from __future__ import print_function, division
 
-import re
 import time
-
-import cherrypy
+from collections import deque
 
 from WMCore.ReqMgr.DataStructs.RequestStatus import REQUEST_START_STATE, ACTIVE_STATUS_FILTER
 
+# frozen copy of the active status filter, used for set membership checks
+_ACTIVE_STATUS_FROZEN = dict((key, frozenset(value)) for key, value in ACTIVE_STATUS_FILTER.items())
+
+# property which can't be task or stepchain property but in dictionary format
+EXCLUDE_PROP_WITH_DICT_FORMAT = frozenset(["LumiList", "AgentJobInfo"])
+
+# sentinel for values not found/cached in RequestInfo
+_MISSING = object()
+
+# immutable value types which can be assigned straight away when cloning a request
+_SCALAR_TYPES = frozenset([str, type(u''), bytes, int, float, bool, type(None)])
+
 
 def initialize_request_args(request, config):
     """
@@ -36,25 +46,30 @@ def initialize_request_args(request, config):
 
     request is changed here.
     """
+    # cherrypy is only needed on the injection path, keep it out of module import
+    import cherrypy
 
     # user information for cert. (which is converted to cherry py log in)
     request["Requestor"] = cherrypy.request.user["login"]
     request["RequestorDN"] = cherrypy.request.user.get("dn", "unknown")
     # service certificates carry @hostname, remove it if it exists
-    request["Requestor"] = request["Requestor"].split('@')[0]
+    request["Requestor"] = request["Requestor"].partition('@')[0]
+
+    # single clock read shared by the transition, request date and request name
+    now = time.time()
 
     # assign first starting status, should be 'new'
     request["RequestStatus"] = REQUEST_START_STATE
     request["RequestTransition"] = [{"Status": request["RequestStatus"],
-                                     "UpdateTime": int(time.time()), "DN": request["RequestorDN"]}]
-    request["RequestDate"] = list(time.gmtime()[:6])
+                                     "UpdateTime": int(now), "DN": request["RequestorDN"]}]
+    request["RequestDate"] = list(time.gmtime(now)[:6])
 
     # update the information from config
     request["CouchURL"] = config.couch_host
     request["CouchWorkloadDBName"] = config.couch_reqmgr_db
     request["CouchDBName"] = config.couch_config_cache_db
 
-    generateRequestName(request)
+    generateRequestName(request, now)
 
 
 def _replace_cloned_args(clone_args, user_args):
@@ -64,14 +79,30 @@ def _replace_cloned_args(clone_args, user_args):
     If the original argument has simple value and user passes dictionary, completely replace to dictionary
     XXX this means LumiList won't remove other runs, only updates runs overwritten
     """
-    for prop in user_args:
-        if isinstance(user_args[prop], dict) and isinstance(clone_args.get(prop), dict):
-            _replace_cloned_args(clone_args.get(prop, {}), user_args[prop])
-        else:
-            clone_args[prop] = user_args[prop]
+    stack = deque([(clone_args, user_args)])
+    while stack:
+        cloneSub, userSub = stack.popleft()
+        for prop, value in userSub.items():
+            if value.__class__ in _SCALAR_TYPES:
+                cloneSub[prop] = value
+                continue
+            current = cloneSub.get(prop)
+            # request arguments are plain dicts decoded from JSON, no subclasses expected
+            if type(value) is dict and type(current) is dict:
+                stack.append((current, value))
+            else:
+                cloneSub[prop] = value
     return
 
 
+def _isChainKey(key):
+    """
+    Check whether key starts like a Task/Step chain key, e.g. Task1 or Step12,
+    without going through the regex engine. Same as re.match(r'(Task|Step)\d{1,2}', key).
+    """
+    return key[:4] in ('Task', 'Step') and '0' <= key[4:5] <= '9'
+
+
 def initialize_clone(requestArgs, originalArgs, argsDefinition, chainDefinition=None):
     """
     Initialize arguments for a clone request by inheriting and overwriting argument
@@ -80,22 +111,28 @@ def initialize_clone(requestArgs, originalArgs, argsDefinition, chainDefinition=
     :param requestArgs: user-provided dictionary with override arguments
     :param originalArgs: original arguments retrieved for the workflow being cloned
     :param argsDefinition: arguments definition according to the workflow type being cloned
-    :param chainDefinition: a dictionary containing the chain argument definition, for
-    StepChain and TaskChain
+     (a dictionary, or any iterable of argument names)
+    :param chainDefinition: a dictionary (or iterable of argument names) containing the
+    chain argument definition, for StepChain and TaskChain
     :return: dictionary with original args filtered out, as per the spec definition. And on
      top of that, user arguments added/replaced in the dictionary.
     """
     chainDefinition = chainDefinition or {}
-    chainPattern = r'(Task|Step)\d{1,2}'
 
     if originalArgs == argsDefinition:
         # then it's a clone/ACDC of another ACDC, nothing else to do
         cloneArgs = originalArgs
     else:
+        # make sure membership tests below are hash lookups
+        if not isinstance(argsDefinition, (dict, set, frozenset)):
+            argsDefinition = frozenset(argsDefinition)
+        if not isinstance(chainDefinition, (dict, set, frozenset)):
+            chainDefinition = frozenset(chainDefinition)
+
         cloneArgs = {}
-        for topKey, topValue in originalArgs.iteritems():
+        for topKey, topValue in originalArgs.items():
             # order of this if-else matters because Step1/Task1 is a known argument
-            if re.match(chainPattern, topKey):
+            if _isChainKey(topKey):
                 cloneArgs.setdefault(topKey, {})
                 # remove unsupported keys from inner Step/Task dict
                 for innerKey in topValue:
@@ -132,25 +169,49 @@ def incrementProcVer(cloneArgs, requestArgs):
     return
 
 
-def generateRequestName(request):
-    currentTime = time.strftime('%y%m%d_%H%M%S', time.localtime(time.time()))
-    seconds = int(10000 * (time.time() % 1.0))
+def generateRequestName(request, now=None):
+    if now is None:
+        now = time.time()
+    currentTime = time.strftime('%y%m%d_%H%M%S', time.localtime(now))
+    # sub-second suffix (0-9999) from the same clock read
+    seconds = int(now * 10000) % 10000
 
     request["RequestName"] = "%s_%s" % (request["Requestor"], request.get("RequestString"))
     request["RequestName"] += "_%s_%s" % (currentTime, seconds)
 
 
-def protectedLFNs(requestInfo):
+def parseOutputDataset(dataset):
+    """
+    Split an output dataset name into the components used to build its
+    unmerged LFN directory: (AcquisitionEra, PrimaryDataset, DataTier, rest)
+    """
+    _, dsn, ps, tier = dataset.split('/', 3)
+    acq, rest = ps.split('-', 1)
+    return acq, dsn, tier, rest
+
+
+def protectedLFNs(requestInfo, datasetPartsCache=None):
+    """
+    Return the unmerged LFN directories of an active request.
+    datasetPartsCache is an optional dictionary mapping output dataset names
+    to their parseOutputDataset result, filled in as datasets get parsed.
+    """
+    outs = requestInfo.get('OutputDatasets')
+    if not outs:
+        # nothing to protect, no need to check the request status
+        return []
+
     reqData = RequestInfo(requestInfo)
     result = []
-    if reqData.andFilterCheck(ACTIVE_STATUS_FILTER):
-        outs = requestInfo.get('OutputDatasets', [])
+    if reqData.andFilterCheck(_ACTIVE_STATUS_FROZEN):
+        if datasetPartsCache is None:
+            datasetPartsCache = {}
         base = requestInfo.get('UnmergedLFNBase', '/store/unmerged')
         for out in outs:
-            dsn, ps, tier = out.split('/')[1:]
-            acq, rest = ps.split('-', 1)
-            dirPath = '/'.join([base, acq, dsn, tier, rest])
-            result.append(dirPath)
+            parts = datasetPartsCache.get(out)
+            if parts is None:
+                parts = datasetPartsCache[out] = parseOutputDataset(out)
+            result.append("%s/%s/%s/%s/%s" % ((base,) + parts))
     return result
 
 
@@ -161,69 +222,76 @@ class RequestInfo(object):
 
     def __init__(self, requestData):
         self.data = requestData
+        # request data is treated as a read-only snapshot, so property lookups can be memoized
+        self._getCache = {}
+        # Task/Step keys are fixed for a given request, build them only once
+        self._chainKeys = None
+        for chainName in ("Task", "Step"):
+            if "%sChain" % chainName in self.data:
+                numLoop = self.data["%sChain" % chainName]
+                self._chainKeys = tuple("%s%d" % (chainName, i + 1) for i in range(numLoop))
+                break
 
-    def _maskTaskStepChain(self, prop, chain_name, default=None):
+    def _maskTaskStepChain(self, prop, default=None):
 
         propExist = False
-        numLoop = self.data["%sChain" % chain_name]
-        for i in range(numLoop):
-            if prop in self.data["%s%s" % (chain_name, i + 1)]:
+        result = set()
+        missing = []
+        for chain_key in self._chainKeys:
+            chain = self.data[chain_key]
+            if prop in chain:
                 propExist = True
-                break
+                result.add(chain[prop])
+            else:
+                missing.append(chain_key)
 
         defaultValue = self.data.get(prop, default)
 
         if propExist:
-            result = set()
-            for i in range(numLoop):
-                chain_key = "%s%s" % (chain_name, i + 1)
-                chain = self.data[chain_key]
-                if prop in chain:
-                    result.add(chain[prop])
+            # fill the gaps with the top level value, if any
+            for chain_key in missing:
+                if isinstance(defaultValue, dict):
+                    value = defaultValue.get(chain_key, None)
                 else:
-                    if isinstance(defaultValue, dict):
-                        value = defaultValue.get(chain_key, None)
-                    else:
-                        value = defaultValue
+                    value = defaultValue
 
-                    if value is not None:
-                        result.add(value)
+                if value is not None:
+                    result.add(value)
             return list(result)
         else:
-            # property which can't be task or stepchain property but in dictionary format
-            exculdePropWithDictFormat = ["LumiList", "AgentJobInfo"]
-            if prop not in exculdePropWithDictFormat and isinstance(defaultValue, dict):
+            if prop not in EXCLUDE_PROP_WITH_DICT_FORMAT and isinstance(defaultValue, dict):
                 return defaultValue.values()
             else:
                 return defaultValue
 
-        return
-
     def get(self, prop, default=None):
         """
         gets the value when prop exist as one of the properties in the request document.
         In case TaskChain, StepChain workflow it searches the property in Task/Step level
         """
 
-        if "TaskChain" in self.data:
-            return self._maskTaskStepChain(prop, "Task")
-        elif "StepChain" in self.data:
-            return self._maskTaskStepChain(prop, "Step")
-        elif prop in self.data:
-            return self.data[prop]
-        else:
+        value = self._getCache.get(prop, _MISSING)
+        if value is _MISSING:
+            if self._chainKeys is not None:
+                value = self._maskTaskStepChain(prop)
+            else:
+                value = self.data.get(prop, _MISSING)
+            self._getCache[prop] = value
+
+        if value is _MISSING:
             return default
+        return value
 
     def andFilterCheck(self, filterDict):
         """
         checks whether filterDict condition met.
-        filterDict is the dict of key and value(list) format)
+        filterDict is the dict of key and value(list or set) format)
         i.e.
         {"RequestStatus": ["running-closed", "completed"],}
         If this request's RequestStatus is either "running-closed", "completed",
         return True, otherwise False
         """
-        for key, value in filterDict.iteritems():
+        for key, value in filterDict.items():
             # special case checks where key is not exist in Request's Doc.
             # It is used whether AgentJobInfo is deleted or not for announced status
             if value == "CLEANED" and key == "AgentJobInfo":
@@ -232,17 +300,21 @@ class RequestInfo(object):
                 else:
                     return False
 
-            if isinstance(value, dict):
+            # filters and request documents are plain JSON decoded objects,
+            # so exact type checks are enough (no dict/list subclasses)
+            if type(value) is dict:
                 # TODO: need to handle dictionary comparison
                 # For now ignore
                 continue
-            elif not isinstance(value, list):
+            elif not isinstance(value, (list, set, frozenset)):
                 value = [value]
 
             reqValue = self.get(key)
             if reqValue is not None:
-                if isinstance(reqValue, list):
-                    if not set(reqValue).intersection(set(value)):
+                if type(reqValue) is list:
+                    if not isinstance(value, (set, frozenset)):
+                        value = frozenset(value)
+                    if not any(item in value for item in reqValue):
                         return False
                 elif reqValue not in value:
                     return False
@@ -258,10 +330,7 @@ class RequestInfo(object):
         ["aborted-completed", "rejected", "announced"]
         DO NOT check if workflow status isn't among those status
         """
-        if 'AgentJobInfo' in self.data:
-            for agentRequestInfo in self.data['AgentJobInfo'].values():
-                if agentRequestInfo.get("status", {}):
-                    return False
         # cannot determin whether AgentJobInfo is cleaned or not when 'AgentJobInfo' Key doesn't exist
         # Maybe JobInformation is not included but since it requested by above status assumed it returns True
-        return True
+        agentJobInfo = self.data.get('AgentJobInfo', {})
+        return not any(agentRequestInfo.get("status", {}) for agentRequestInfo in agentJobInfo.values())
@@ -8,8 +8,4 @@ Oracle implementation of ResourceControl.ListThresholdsForSubmit
 
 
 
-from WMCore.ResourceControl.MySQL.ListThresholdsForSubmit \
-     import ListThresholdsForSubmit as MySQLListThresholdsForSubmit
-
-class ListThresholdsForSubmit(MySQLListThresholdsForSubmit):
-    pass
+from WMCore.ResourceControl.MySQL.ListThresholdsForSubmit import ListThresholdsForSubmit
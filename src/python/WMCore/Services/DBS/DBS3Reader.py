@@ -657,13 +657,16 @@ class DBS3Reader(object):
 
         return locations
 
-    def getFileBlock(self, fileBlockName, dbsOnly=False):
+    def getFileBlock(self, fileBlockName, dbsOnly=False, locations=None):
         """
         _getFileBlock_
 
         dbsOnly flag is mostly meant for StoreResults, since there is no
         data in TMDB.
 
+        locations can be provided when the block location was already
+        looked up (e.g. for many blocks at once), then it's not queried again.
+
         return a dictionary:
         { blockName: {
              "PhEDExNodeNames" : [<pnn list>],
@@ -680,15 +683,18 @@ class DBS3Reader(object):
             msg = "DBSReader.getFileBlock(%s): No matching data"
             raise DBSReaderError(msg % fileBlockName)
 
+        if locations is None:
+            locations = self.listFileBlockLocation(fileBlockName, dbsOnly)
+
         result = {fileBlockName: {
-            "PhEDExNodeNames": self.listFileBlockLocation(fileBlockName, dbsOnly),
+            "PhEDExNodeNames": locations,
             "Files": self.listFilesInBlock(fileBlockName),
             "IsOpen": self.blockIsOpen(fileBlockName)
             }
         }
         return result
 
-    def getFileBlockWithParents(self, fileBlockName):
+    def getFileBlockWithParents(self, fileBlockName, locations=None):
         """
         _getFileBlockWithParents_
 
@@ -701,6 +707,8 @@ class DBS3Reader(object):
 
         files
 
+        locations can be provided when the block location was already looked up.
+
         """
         if isinstance(fileBlockName, str):
             fileBlockName = unicode(fileBlockName)
@@ -709,8 +717,11 @@ class DBS3Reader(object):
             msg = "DBSReader.getFileBlockWithParents(%s): No matching data"
             raise DBSReaderError(msg % fileBlockName)
 
+        if locations is None:
+            locations = self.listFileBlockLocation(fileBlockName)
+
         result = {fileBlockName: {
-            "PhEDExNodeNames": self.listFileBlockLocation(fileBlockName),
+            "PhEDExNodeNames": locations,
             "Files": self.listFilesInBlockWithParents(fileBlockName),
             "IsOpen": self.blockIsOpen(fileBlockName)
             }
@@ -84,6 +84,9 @@ Example initial processing task
  },
 """
 from __future__ import division
+
+from copy import copy
+
 from Utils.Utilities import makeList, strToBool
 from WMCore.Lexicon import primdataset
 from WMCore.WMSpec.StdSpecs.StdBase import StdBase
@@ -92,119 +95,95 @@ from WMCore.WMSpec.WMWorkloadTools import validateArgumentsCreate, parsePileupCo
 #
 # simple utils for data mining the request dictionary
 #
-isGenerator = lambda args: not args["Task1"].get("InputDataset", None)
-parentTaskModule = lambda args: args.get("InputFromOutputModule", None)
-
-
-class ParameterStorage(object):
+def isGenerator(args):
     """
-    _ParameterStorage_
-
-    Decorator class which storages global parameters,
-    sets them to local values before executing the passed function
-    and restores them afterwards. This is only suited to decorate the
-    setupTask and setupGeneratorTask in TaskChainWorkloadFactory.
+    Whether the first task generates events instead of processing an input dataset
     """
+    return not args["Task1"].get("InputDataset")
 
-    def __init__(self, func):
-        """
-        __init__
 
-        Stores the function and valid parameters to save/restore.
-
-        The validParameters dictionary contains a mapping from the name of the attribute
-        in StdBase to the argument key in the task dictionaries
-        """
-        self.func = func
-        self.validParameters = {'globalTag': 'GlobalTag',
-                                'frameworkVersion': 'CMSSWVersion',
-                                'scramArch': 'ScramArch',
-                                'processingVersion': 'ProcessingVersion',
-                                'processingString': 'ProcessingString',
-                                'acquisitionEra': 'AcquisitionEra',
-                                'timePerEvent': 'TimePerEvent',
-                                'sizePerEvent': 'SizePerEvent',
-                                'memory': 'Memory'
-                               }
-        return
+parentTaskModule = lambda args: args.get("InputFromOutputModule", None)
 
-    def __get__(self, instance, owner):
-        """
-        __get__
 
-        Get method for the class, store the calling instance for latter use
-        """
-        self.obj = instance
-        self.cls = owner
-        return self.__call__
+def _positive(value):
+    """
+    Validator shared by the strictly positive spec arguments
+    """
+    return value > 0
 
-    def __call__(self, task, taskConf):
-        """
-        __call__
 
-        Store the global parameters, alters the parameters
-        using the taskConf argument. Executes the stored
-        method, then restores the parameters and resets the local instance.
-        """
-        self.storeParameters()
-        self.alterParameters(taskConf)
-        self.func(self.obj, task, taskConf)
-        self.restoreParameters()
-        self.resetParameters()
-        return
+class ParameterStorage(object):
+    """
+    _ParameterStorage_
 
-    def storeParameters(self):
+    Context manager which stores global parameters, sets them to
+    the task specific values on entering and restores them on exit.
+    This is only suited to wrap the setupTask and setupGeneratorTask
+    bodies in TaskChainWorkloadFactory.
+    """
+    # pairs of the attribute name in StdBase and the argument key in the task dictionaries
+    validParameters = (('globalTag', 'GlobalTag'),
+                       ('frameworkVersion', 'CMSSWVersion'),
+                       ('scramArch', 'ScramArch'),
+                       ('processingVersion', 'ProcessingVersion'),
+                       ('processingString', 'ProcessingString'),
+                       ('acquisitionEra', 'AcquisitionEra'),
+                       ('timePerEvent', 'TimePerEvent'),
+                       ('sizePerEvent', 'SizePerEvent'),
+                       ('memory', 'Memory'))
+
+    def __init__(self, obj, taskConf):
         """
-        _storeParameters_
+        __init__
 
-        Store the original parameters in the decorator
+        Keep the factory instance whose parameters get altered
+        and the task configuration to alter them with.
         """
-        for param in self.validParameters:
-            globalValue = getattr(self.obj, param, None)
-            setattr(self, param, globalValue)
-        return
+        self.obj = obj
+        self.taskConf = taskConf
+        self.globalValues = ()
 
-    def alterParameters(self, taskConf):
+    def __enter__(self):
         """
-        _alterParameters_
+        __enter__
 
-        Alter the parameters with the specific task configuration
+        Store the global parameters in a tuple and alter them
+        with the specific task configuration
         """
-        for param in self.validParameters:
+        # these are all plain instance attributes (no properties), use the instance dict directly
+        objDict = vars(self.obj)
+        self.globalValues = tuple(objDict.get(param) for param, _ in self.validParameters)
+        for (param, taskKey), globalValue in zip(self.validParameters, self.globalValues):
             # if task arg is None or 0 or "", then reuse the global one
-            taskValue = getattr(self, param)
-            if taskConf.get(self.validParameters[param]):
-                taskValue = taskConf[self.validParameters[param]]
-            setattr(self.obj, param, taskValue)
-        return
+            taskValue = self.taskConf.get(taskKey)
+            objDict[param] = taskValue if taskValue else globalValue
+        return self
 
-    def restoreParameters(self):
+    def __exit__(self, excType, excValue, traceback):
         """
-        _restoreParameters_
+        __exit__
 
         Restore the parameters to the global values
         """
-        for param in self.validParameters:
-            globalValue = getattr(self, param)
-            setattr(self.obj, param, globalValue)
-        return
-
-    def resetParameters(self):
-        """
-        _resetParameters_
-
-        Reset parameters to None
-        """
-        for param in self.validParameters:
-            setattr(self, param, None)
-        return
+        objDict = vars(self.obj)
+        for (param, _), globalValue in zip(self.validParameters, self.globalValues):
+            objDict[param] = globalValue
+        return False
 
 
 class TaskChainWorkloadFactory(StdBase):
+    # (class, firstTask, generator) -> chain arguments definition, see _getCachedChainCreateArgs
+    _chainCreateArgsCache = {}
+    # (class, firstTask, generator) -> (argument defaults, argument types), see _getChainArgsDefaultsAndTypes
+    _chainArgsDefaultsAndTypesCache = {}
+
     def __init__(self):
         StdBase.__init__(self)
+        # (task name, output module name) -> task providing the (merged or unmerged) output
         self.mergeMapping = {}
+        # task name -> modified task configuration
         self.taskMapping = {}
+        self.workload = None
 
     def __call__(self, workloadName, arguments):
         """
@@ -214,6 +193,8 @@ class TaskChainWorkloadFactory(StdBase):
         """
         StdBase.__call__(self, workloadName, arguments)
         self.workload = self.createWorkload()
+        taskKeys = ["Task%d" % i for i in range(1, self.taskChain + 1)]
+        generator = isGenerator(arguments)
 
         # Detect blow-up factor from first task in chain.
         blowupFactor = 1
@@ -221,25 +202,17 @@ class TaskChainWorkloadFactory(StdBase):
             origTpe = arguments["Task1"]['TimePerEvent']
             if origTpe <= 0:
                 origTpe = 1.0
-            sumTpe = 0
-            tpeCount = 0
-            for i in xrange(1, self.taskChain + 1):
-                if 'TimePerEvent' in arguments["Task%d" % i]:
-                    sumTpe += arguments["Task%d" % i]['TimePerEvent']
-                    tpeCount += 1
-            if tpeCount > 0:
-                blowupFactor = sumTpe / origTpe
-
-        for i in xrange(1, self.taskChain + 1):
-
-            originalTaskConf = arguments["Task%d" % i]
-            taskConf = {}
+            # Task1 is known to carry TimePerEvent, so there is always at least one value
+            taskTpes = [arguments[taskKey].get('TimePerEvent') for taskKey in taskKeys]
+            blowupFactor = sum(tpe for tpe in taskTpes if tpe is not None) / origTpe
+
+        for i, taskKey in enumerate(taskKeys, 1):
+
             # Make a shallow copy of the taskConf
-            for k, v in originalTaskConf.items():
-                taskConf[k] = v
+            taskConf = arguments[taskKey].copy()
             parent = taskConf.get("InputTask", None)
 
-            self.modifyTaskConfiguration(taskConf, i == 1, i == 1 and 'InputDataset' not in taskConf)
+            self.modifyTaskConfiguration(taskConf, i == 1, i == 1 and generator)
 
             # Set task-specific global parameters
             self.blockBlacklist = taskConf["BlockBlacklist"]
@@ -248,15 +221,15 @@ class TaskChainWorkloadFactory(StdBase):
             self.runWhitelist = taskConf["RunWhitelist"]
 
             parentTask = None
-            if parent in self.mergeMapping:
-                parentTask = self.mergeMapping[parent][parentTaskModule(taskConf)]
+            if parent in self.taskMapping:
+                parentTask = self.mergeMapping[(parent, parentTaskModule(taskConf))]
 
             task = self.makeTask(taskConf, parentTask)
 
             if i == 1:
                 # First task will either be generator or processing
                 self.workload.setDashboardActivity("relval")
-                if isGenerator(arguments):
+                if generator:
                     # generate mc events
                     self.workload.setWorkQueueSplitPolicy("MonteCarlo", taskConf['SplittingAlgo'],
                                                           taskConf['SplittingArguments'],
@@ -297,59 +270,75 @@ class TaskChainWorkloadFactory(StdBase):
     def _updateCommonParams(self, task, taskConf):
         # sets the prepID  all the properties need to be set by
         # self.workload.setTaskPropertiesFromWorkload manually for the task
-        task.setPrepID(taskConf.get("PrepID", self.workload.getPrepID()))
-        task.setAcquisitionEra(taskConf.get("AcquisitionEra", self.workload.getAcquisitionEra()))
-        task.setProcessingString(taskConf.get("ProcessingString", self.workload.getProcessingString()))
-        task.setProcessingVersion(taskConf.get("ProcessingVersion", self.workload.getProcessingVersion()))
-        lumiMask = taskConf.get("LumiList", self.workload.getLumiList())
+        # only fall back to (i.e. call) the workload getters when the task doesn't define the value
+        workload = self.workload
+        task.setPrepID(taskConf["PrepID"] if "PrepID" in taskConf else workload.getPrepID())
+        task.setAcquisitionEra(taskConf["AcquisitionEra"] if "AcquisitionEra" in taskConf
+                               else workload.getAcquisitionEra())
+        task.setProcessingString(taskConf["ProcessingString"] if "ProcessingString" in taskConf
+                                 else workload.getProcessingString())
+        task.setProcessingVersion(taskConf["ProcessingVersion"] if "ProcessingVersion" in taskConf
+                                  else workload.getProcessingVersion())
+        lumiMask = taskConf["LumiList"] if "LumiList" in taskConf else workload.getLumiList()
         if lumiMask:
             task.setLumiMask(lumiMask)
 
         if taskConf["PileupConfig"]:
             self.setupPileup(task, taskConf['PileupConfig'])
 
-    @ParameterStorage
+    def _getProcessingTaskArgs(self, taskConf, splitArguments, cmsswVersion, scramArch):
+        """
+        _getProcessingTaskArgs_
+
+        Build the setupProcessingTask keyword arguments common to
+        generator and processing tasks. This is the only place the task
+        TimePerEvent, SizePerEvent and Memory are looked up for it.
+        """
+        forceUnmerged = (not taskConf["KeepOutput"]) or (len(taskConf["TransientOutputModules"]) > 0)
+        return dict(couchDBName=self.couchDBName,
+                    configCacheUrl=self.configCacheUrl,
+                    configDoc=taskConf["ConfigCacheID"],
+                    splitAlgo=taskConf["SplittingAlgo"],
+                    splitArgs=splitArguments,
+                    stepType="CMSSW",
+                    forceUnmerged=forceUnmerged,
+                    timePerEvent=taskConf.get('TimePerEvent'),
+                    sizePerEvent=taskConf.get('SizePerEvent'),
+                    memoryReq=taskConf.get('Memory'),
+                    cmsswVersion=cmsswVersion,
+                    scramArch=scramArch,
+                    taskConf=taskConf)
+
     def setupGeneratorTask(self, task, taskConf):
         """
         _setupGeneratorTask_
 
         Set up an initial generation task
         """
-        cmsswStepType = "CMSSW"
-        configCacheID = taskConf['ConfigCacheID']
-        splitAlgorithm = taskConf["SplittingAlgo"]
-        splitArguments = taskConf["SplittingArguments"]
-        keepOutput = taskConf["KeepOutput"]
-        transientModules = taskConf["TransientOutputModules"]
-        forceUnmerged = (not keepOutput) or (len(transientModules) > 0)
-        cmsswVersion = taskConf.get('CMSSWVersion', self.frameworkVersion)
-        scramArch = taskConf.get('ScramArch', self.scramArch)
-        self.inputPrimaryDataset = taskConf['PrimaryDataset']
-        outputMods = self.setupProcessingTask(task, "Production", couchDBName=self.couchDBName,
-                                              configDoc=configCacheID, configCacheUrl=self.configCacheUrl,
-                                              splitAlgo=splitAlgorithm, splitArgs=splitArguments,
-                                              stepType=cmsswStepType, seeding=taskConf['Seeding'],
-                                              totalEvents=taskConf['RequestNumEvents'],
-                                              forceUnmerged=forceUnmerged,
-                                              timePerEvent=taskConf.get('TimePerEvent', None),
-                                              sizePerEvent=taskConf.get('SizePerEvent', None),
-                                              memoryReq=taskConf.get('Memory', None),
-                                              cmsswVersion=cmsswVersion,
-                                              scramArch=scramArch,
-                                              taskConf=taskConf)
-
-        self.addLogCollectTask(task, 'LogCollectFor%s' % task.name(), cmsswVersion=cmsswVersion, scramArch=scramArch)
-
-        # Do the output module merged/unmerged association
-        self.setUpMergeTasks(task, outputMods, splitAlgorithm, keepOutput, transientModules,
-                             cmsswVersion=cmsswVersion, scramArch=scramArch)
-
-        # this need to be called after setpuProcessingTask since it will overwrite some values
-        self._updateCommonParams(task, taskConf)
+        with ParameterStorage(self, taskConf):
+            splitAlgorithm = taskConf["SplittingAlgo"]
+            splitArguments = taskConf["SplittingArguments"]
+            keepOutput = taskConf["KeepOutput"]
+            transientModules = taskConf["TransientOutputModules"]
+            cmsswVersion = taskConf.get('CMSSWVersion', self.frameworkVersion)
+            scramArch = taskConf.get('ScramArch', self.scramArch)
+            self.inputPrimaryDataset = taskConf['PrimaryDataset']
+            procTaskArgs = self._getProcessingTaskArgs(taskConf, splitArguments, cmsswVersion, scramArch)
+            outputMods = self.setupProcessingTask(task, "Production", seeding=taskConf['Seeding'],
+                                                  totalEvents=taskConf['RequestNumEvents'],
+                                                  **procTaskArgs)
+
+            self.addLogCollectTask(task, 'LogCollectFor%s' % task.name(), cmsswVersion=cmsswVersion, scramArch=scramArch)
+
+            # Do the output module merged/unmerged association
+            self.setUpMergeTasks(task, outputMods, splitAlgorithm, keepOutput, transientModules,
+                                 cmsswVersion=cmsswVersion, scramArch=scramArch)
+
+            # this need to be called after setpuProcessingTask since it will overwrite some values
+            self._updateCommonParams(task, taskConf)
 
         return
 
-    @ParameterStorage
     def setupTask(self, task, taskConf):
         """
         _setupTask_
@@ -357,75 +346,62 @@ class TaskChainWorkloadFactory(StdBase):
         Build the task using the setupProcessingTask from StdBase
         and set the parents appropriately to handle a processing task
         """
-
-        cmsswStepType = "CMSSW"
-        configCacheID = taskConf["ConfigCacheID"]
-        splitAlgorithm = taskConf["SplittingAlgo"]
-        splitArguments = taskConf["SplittingArguments"]
-        keepOutput = taskConf["KeepOutput"]
-        transientModules = taskConf["TransientOutputModules"]
-        forceUnmerged = (not keepOutput) or (len(transientModules) > 0)
-        cmsswVersion = taskConf.get('CMSSWVersion', self.frameworkVersion)
-        scramArch = taskConf.get('ScramArch', self.scramArch)
-
-        # in case the initial task is a processing task, we have an input dataset, otherwise
-        # we look up the parent task and step
-        inputDataset = taskConf.get("InputDataset")
-        if inputDataset is not None:
-            self.inputDataset = inputDataset
-            (self.inputPrimaryDataset, self.inputProcessedDataset,
-             self.inputDataTier) = self.inputDataset[1:].split("/")
-            inpStep = None
-            inpMod = None
-        else:
-            self.inputDataset = None
-            inputTask = taskConf["InputTask"]
-            inputTaskConf = self.taskMapping[inputTask]
-            parentTaskForMod = self.mergeMapping[inputTask][taskConf['InputFromOutputModule']]
-            inpStep = parentTaskForMod.getStep("cmsRun1")
-            if not inputTaskConf["KeepOutput"] or len(inputTaskConf["TransientOutputModules"]) > 0:
-                inpMod = taskConf["InputFromOutputModule"]
-                # Check if the splitting has to be changed
-                if inputTaskConf["SplittingAlgo"] == 'EventBased' \
-                        and (inputTaskConf.get("InputDataset") or inputTaskConf.get("InputTask")):
-                    splitAlgorithm = 'WMBSMergeBySize'
-                    splitArguments = {'max_merge_size': self.maxMergeSize,
-                                      'min_merge_size': self.minMergeSize,
-                                      'max_merge_events': self.maxMergeEvents,
-                                      'max_wait_time': self.maxWaitTime}
+        with ParameterStorage(self, taskConf):
+            splitAlgorithm = taskConf["SplittingAlgo"]
+            splitArguments = taskConf["SplittingArguments"]
+            keepOutput = taskConf["KeepOutput"]
+            transientModules = taskConf["TransientOutputModules"]
+            cmsswVersion = taskConf.get('CMSSWVersion', self.frameworkVersion)
+            scramArch = taskConf.get('ScramArch', self.scramArch)
+
+            # in case the initial task is a processing task, we have an input dataset, otherwise
+            # we look up the parent task and step
+            inputDataset = taskConf.get("InputDataset")
+            if inputDataset is not None:
+                self.inputDataset = inputDataset
+                (_, self.inputPrimaryDataset, self.inputProcessedDataset,
+                 self.inputDataTier) = inputDataset.split("/", 3)
+                inpStep = None
+                inpMod = None
             else:
-                inpMod = "Merged"
-
-        currentPrimaryDataset = self.inputPrimaryDataset
-        if taskConf.get("PrimaryDataset") is not None:
-            self.inputPrimaryDataset = taskConf.get("PrimaryDataset")
-
-        outputMods = self.setupProcessingTask(task, "Processing",
-                                              inputDataset,
-                                              inputStep=inpStep,
-                                              inputModule=inpMod,
-                                              couchDBName=self.couchDBName,
-                                              configCacheUrl=self.configCacheUrl,
-                                              configDoc=configCacheID,
-                                              splitAlgo=taskConf["SplittingAlgo"],
-                                              splitArgs=splitArguments,
-                                              stepType=cmsswStepType,
-                                              forceUnmerged=forceUnmerged,
-                                              timePerEvent=taskConf.get('TimePerEvent', None),
-                                              sizePerEvent=taskConf.get('SizePerEvent', None),
-                                              memoryReq=taskConf.get("Memory", None),
-                                              cmsswVersion=cmsswVersion,
-                                              scramArch=scramArch,
-                                              taskConf=taskConf)
-
-        self.addLogCollectTask(task, 'LogCollectFor%s' % task.name(), cmsswVersion=cmsswVersion, scramArch=scramArch)
-        self.setUpMergeTasks(task, outputMods, splitAlgorithm, keepOutput, transientModules,
-                             cmsswVersion=cmsswVersion, scramArch=scramArch)
-
-        self.inputPrimaryDataset = currentPrimaryDataset
-
-        # this need to be called after setpuProcessingTask since it will overwrite some values
-        self._updateCommonParams(task, taskConf)
+                self.inputDataset = None
+                inputTask = taskConf["InputTask"]
+                inputTaskConf = self.taskMapping[inputTask]
+                parentTaskForMod = self.mergeMapping[(inputTask, taskConf['InputFromOutputModule'])]
+                inpStep = parentTaskForMod.getStep("cmsRun1")
+                if not inputTaskConf["KeepOutput"] or len(inputTaskConf["TransientOutputModules"]) > 0:
+                    inpMod = taskConf["InputFromOutputModule"]
+                    # Check if the splitting has to be changed
+                    if inputTaskConf["SplittingAlgo"] == 'EventBased' \
+                            and (inputTaskConf.get("InputDataset") or inputTaskConf.get("InputTask")):
+                        splitAlgorithm = 'WMBSMergeBySize'
+                        splitArguments = {'max_merge_size': self.maxMergeSize,
+                                          'min_merge_size': self.minMergeSize,
+                                          'max_merge_events': self.maxMergeEvents,
+                                          'max_wait_time': self.maxWaitTime}
+                else:
+                    inpMod = "Merged"
+
+            currentPrimaryDataset = self.inputPrimaryDataset
+            primaryDataset = taskConf.get("PrimaryDataset")
+            if primaryDataset is not None:
+                self.inputPrimaryDataset = primaryDataset
+
+            procTaskArgs = self._getProcessingTaskArgs(taskConf, splitArguments, cmsswVersion, scramArch)
+            outputMods = self.setupProcessingTask(task, "Processing",
+                                                  inputDataset,
+                                                  inputStep=inpStep,
+                                                  inputModule=inpMod,
+                                                  **procTaskArgs)
+
+            self.addLogCollectTask(task, 'LogCollectFor%s' % task.name(), cmsswVersion=cmsswVersion, scramArch=scramArch)
+            self.setUpMergeTasks(task, outputMods, splitAlgorithm, keepOutput, transientModules,
+                                 cmsswVersion=cmsswVersion, scramArch=scramArch)
+
+            self.inputPrimaryDataset = currentPrimaryDataset
+
+            # this need to be called after setpuProcessingTask since it will overwrite some values
+            self._updateCommonParams(task, taskConf)
 
         return
 
@@ -440,23 +416,27 @@ class TaskChainWorkloadFactory(StdBase):
         If not merged then only a cleanup task is created.
         """
         modulesToMerge = []
-        unmergedModules = outputModules.keys()
-        if keepOutput:
-            unmergedModules = [x for x in outputModules.keys() if x in transientOutputModules]
-            modulesToMerge = [x for x in outputModules.keys() if x not in transientOutputModules]
-
-        procMergeTasks = {}
-        for outputModuleName in modulesToMerge:
-            mergeTask = self.addMergeTask(parentTask, splittingAlgo,
-                                          outputModuleName, cmsswVersion=cmsswVersion, scramArch=scramArch)
-            procMergeTasks[str(outputModuleName)] = mergeTask
-        self.mergeMapping[parentTask.name()] = procMergeTasks
-
-        procTasks = {}
+        unmergedModules = []
+        transientOutputModules = frozenset(transientOutputModules)
+        for outputModuleName in outputModules:
+            if keepOutput and outputModuleName not in transientOutputModules:
+                modulesToMerge.append(outputModuleName)
+            else:
+                unmergedModules.append(outputModuleName)
+
+        parentTaskName = parentTask.name()
+        procMergeTasks = {(parentTaskName, str(outputModuleName)):
+                              self.addMergeTask(parentTask, splittingAlgo, outputModuleName,
+                                                cmsswVersion=cmsswVersion, scramArch=scramArch)
+                          for outputModuleName in modulesToMerge}
+
         for outputModuleName in unmergedModules:
             self.addCleanupTask(parentTask, outputModuleName, dataTier=outputModules[outputModuleName]['dataTier'])
-            procTasks[outputModuleName] = parentTask
-        self.mergeMapping[parentTask.name()].update(procTasks)
+        procTasks = dict.fromkeys([(parentTaskName, outputModuleName) for outputModuleName in unmergedModules],
+                                  parentTask)
+
+        self.mergeMapping.update(procMergeTasks)
+        self.mergeMapping.update(procTasks)
 
         return
 
@@ -470,12 +450,14 @@ class TaskChainWorkloadFactory(StdBase):
         It does type casting and assigns default values if key is not
         present, unless default value is None.
         """
-        taskArguments = self.getChainCreateArgs(firstTask, generator)
-        for argument in taskArguments:
-            if argument not in taskConf and taskArguments[argument]["default"] is not None:
-                taskConf[argument] = taskArguments[argument]["default"]
-            elif argument in taskConf:
-                taskConf[argument] = taskArguments[argument]["type"](taskConf[argument])
+        argDefaults, argTypes = self._getChainArgsDefaultsAndTypes(firstTask, generator)
+        for argument, argType in argTypes:
+            if argument in taskConf:
+                taskConf[argument] = argType(taskConf[argument])
+        for argument, default in argDefaults:
+            if argument not in taskConf:
+                # definitions are shared among tasks, don't hand out the same mutable default
+                taskConf[argument] = copy(default) if isinstance(default, (list, dict)) else default
 
         if generator:
             taskConf["SplittingAlgo"] = "EventBased"
@@ -518,13 +500,13 @@ class TaskChainWorkloadFactory(StdBase):
                     "ConfigCacheID": {"optional": True, "null": True},
                     "IgnoredOutputModules": {"default": [], "type": makeList, "null": False},
                     "TaskChain": {"default": 1, "type": int,
-                                  "optional": False, "validate": lambda x: x > 0,
+                                  "optional": False, "validate": _positive,
                                   "attr": "taskChain", "null": False},
                     "FirstEvent": {"default": 1, "type": int,
-                                   "optional": True, "validate": lambda x: x > 0,
+                                   "optional": True, "validate": _positive,
                                    "attr": "firstEvent", "null": False},
                     "FirstLumi": {"default": 1, "type": int,
-                                  "optional": True, "validate": lambda x: x > 0,
+                                  "optional": True, "validate": _positive,
                                   "attr": "firstLumi", "null": False}
                    }
         baseArgs.update(specArgs)
@@ -548,8 +530,8 @@ class TaskChainWorkloadFactory(StdBase):
             "TransientOutputModules": {"default": [], "type": makeList, "optional": True, "null": False},
             "DeterministicPileup": {"default": False, "type": strToBool, "optional": True, "null": False},
             "GlobalTag": {"type": str, "optional": True},
-            "TimePerEvent": {"type": float, "optional": True, "validate": lambda x: x > 0},
-            "SizePerEvent": {"type": float, "optional": True, "validate": lambda x: x > 0},
+            "TimePerEvent": {"type": float, "optional": True, "validate": _positive},
+            "SizePerEvent": {"type": float, "optional": True, "validate": _positive},
             'PrimaryDataset': {'default': None, 'optional': not generator, 'validate': primdataset,
                                'null': False},
                     }
@@ -557,6 +539,38 @@ class TaskChainWorkloadFactory(StdBase):
         StdBase.setDefaultArgumentsProperty(baseArgs)
         return baseArgs
 
+    @classmethod
+    def _getCachedChainCreateArgs(cls, firstTask=False, generator=False):
+        """
+        _getCachedChainCreateArgs_
+
+        Memoized getChainCreateArgs, since its result only depends on the
+        two flags. The returned dictionary is shared, so it must be
+        treated as read-only.
+        """
+        key = (cls, bool(firstTask), bool(generator))
+        if key not in cls._chainCreateArgsCache:
+            cls._chainCreateArgsCache[key] = cls.getChainCreateArgs(key[1], key[2])
+        return cls._chainCreateArgsCache[key]
+
+    @classmethod
+    def _getChainArgsDefaultsAndTypes(cls, firstTask=False, generator=False):
+        """
+        _getChainArgsDefaultsAndTypes_
+
+        Return two tuples derived from the (cached) chain arguments definition:
+        (argument, default) for the arguments with a not None default, and
+        (argument, type) for all the arguments.
+        """
+        key = (cls, bool(firstTask), bool(generator))
+        if key not in cls._chainArgsDefaultsAndTypesCache:
+            taskArguments = cls._getCachedChainCreateArgs(firstTask, generator)
+            argDefaults = tuple((arg, argDef["default"]) for arg, argDef in taskArguments.items()
+                                if argDef["default"] is not None)
+            argTypes = tuple((arg, argDef["type"]) for arg, argDef in taskArguments.items())
+            cls._chainArgsDefaultsAndTypesCache[key] = (argDefaults, argTypes)
+        return cls._chainArgsDefaultsAndTypesCache[key]
+
     def validateSchema(self, schema):
         """
         _validateSchema_
@@ -566,10 +580,12 @@ class TaskChainWorkloadFactory(StdBase):
         """
         numTasks = schema['TaskChain']
         transientMapping = {}
-        for i in xrange(1, numTasks + 1):
-            taskNumber = "Task%s" % i
+        # all the tasks but the first one share the same (read-only) definition
+        chainArgs = self._getCachedChainCreateArgs()
+        for i in range(1, numTasks + 1):
+            taskNumber = "Task%d" % i
             if taskNumber not in schema:
-                msg = "No Task%s entry present in request" % i
+                msg = "No %s entry present in request" % taskNumber
                 self.raiseValidationException(msg=msg)
 
             task = schema[taskNumber]
@@ -580,7 +596,10 @@ class TaskChainWorkloadFactory(StdBase):
                 self.raiseValidationException(msg=msg)
 
             # Generic task parameter validation
-            self.validateTask(task, self.getChainCreateArgs(i == 1, i == 1 and 'InputDataset' not in task))
+            if i == 1:
+                self.validateTask(task, self._getCachedChainCreateArgs(True, isGenerator(schema)))
+            else:
+                self.validateTask(task, chainArgs)
 
             # Validate the existence of the configCache
             if task["ConfigCacheID"]:
@@ -590,12 +609,10 @@ class TaskChainWorkloadFactory(StdBase):
                                                getOutputModules=False)
 
             # Validate the chaining of transient output modules, need to make a copy of the lists
-            transientMapping[task['TaskName']] = [x for x in task.get('TransientOutputModules', [])]
+            transientMapping[task['TaskName']] = set(task.get('TransientOutputModules', []))
 
             if i > 1:
-                inputTransientModules = transientMapping[task['InputTask']]
-                if task['InputFromOutputModule'] in inputTransientModules:
-                    inputTransientModules.remove(task['InputFromOutputModule'])
+                transientMapping[task['InputTask']].discard(task['InputFromOutputModule'])
 
         for task in transientMapping:
             if transientMapping[task]:
@@ -7,21 +7,85 @@ Implementation of an Executor for a DQMUpload step
 """
 from __future__ import print_function
 
+import io
 import os
 import sys
 import logging
+import mmap
 import urllib2
+import zlib
 from cStringIO import StringIO
-from functools import reduce
-from gzip import GzipFile
 from hashlib import md5
 from mimetypes import guess_type
+from multiprocessing.pool import ThreadPool
 
 from WMCore.FwkJobReport.Report import Report
 from WMCore.Services.HTTPS.HTTPSAuthHandler import HTTPSAuthHandler
 from WMCore.WMSpec.Steps.Executor import Executor
 from WMCore.WMSpec.Steps.WMExecutionFailure import WMExecutionFailure
 
+# maximum number of DQM files uploaded at the same time
+MAX_CONCURRENT_UPLOADS = 4
+
+# maximum size of the DQM files memory mapped to compute their checksum
+MAX_MMAP_CHECKSUM_SIZE = 2 * 1024 ** 3
+
+# content types of the uploaded files, keyed by file extension
+_MIME_TYPES = {}
+
+# multipart/form-data framing, the same for every upload
+_BOUNDARY = '----------=_DQM_FILE_BOUNDARY_=-----------'
+_CRLF = '\r\n'
+_BOUNDARY_LINE = '--' + _BOUNDARY + _CRLF
+_END_BOUNDARY = _CRLF + '--' + _BOUNDARY + '--' + _CRLF + _CRLF
+_CONTENT_TYPE = 'multipart/form-data; boundary=' + _BOUNDARY
+
+
+class MultipartBody(object):
+    """
+    _MultipartBody_
+
+    Read-only file-like object concatenating in-memory strings and open
+    files, used as a POST body. httplib sends objects providing read() in
+    blocks, so the (potentially very large) files are never fully loaded
+    in memory. Files are given as (file object, size) pairs, they are read
+    from their current position and are not closed, they belong to the caller.
+
+    """
+
+    def __init__(self, parts):
+        self.parts = []
+        # the Content-Length is known upfront from the file sizes, without reading them
+        self.length = 0
+        for part in parts:
+            if isinstance(part, str):
+                self.parts.append(StringIO(part))
+                self.length += len(part)
+            else:
+                (fileobj, size) = part
+                self.parts.append(fileobj)
+                self.length += size
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        """
+        Read up to size bytes (everything left if size is negative),
+        moving on to the next part whenever the current one is exhausted
+        """
+        chunks = []
+        while self.parts:
+            chunk = self.parts[0].read(size)
+            if size < 0 or len(chunk) < size:
+                self.parts.pop(0)
+            chunks.append(chunk)
+            if size >= 0:
+                size -= len(chunk)
+                if size == 0:
+                    break
+        return ''.join(chunks)
+
 
 class DQMUpload(Executor):
     """
@@ -29,8 +93,16 @@ class DQMUpload(Executor):
 
     Execute a DQMUpload Step
 
+    Emulation is dispatched by ExecuteMaster, which runs the step emulator
+    instead of this executor, so the emulator arguments are never used here.
+
     """
 
+    def __init__(self):
+        Executor.__init__(self)
+        # url openers, keyed by whether they are used for https urls
+        self.openers = {}
+
     def pre(self, emulator=None):
         """
         _pre_
@@ -38,10 +110,6 @@ class DQMUpload(Executor):
         Pre execution checks
 
         """
-        # Are we using an emulator?
-        if emulator is not None:
-            return emulator.emulatePre(self.step)
-
         logging.info("Steps.Executors.DQMUpload.pre called")
         return None
 
@@ -50,33 +118,41 @@ class DQMUpload(Executor):
         _execute_
 
         """
-        # Are we using emulators again?
-        if emulator is not None:
-            return emulator.emulate(self.step, self.job)
-
-        if self.step.upload.proxy:
+        uploadProxy = self.step.upload.proxy
+        if uploadProxy:
             try:
-                self.stepSpace.getFromSandbox(self.step.upload.proxy)
+                self.stepSpace.getFromSandbox(uploadProxy)
             except Exception as ex:
                 # Let it go, it wasn't in the sandbox. Then it must be
                 # somewhere else
                 del ex
 
         # Search through steps for analysis files
-        for step in self.stepSpace.taskSpace.stepSpaces():
-            if step == self.stepName:
+        dqmFiles = []
+        taskSpace = self.stepSpace.taskSpace
+        taskLocation = taskSpace.location
+        myStepName = self.stepName
+        for step in taskSpace.stepSpaces():
+            if step == myStepName:
                 # Don't try to parse your own report; it's not there yet
                 continue
-            stepLocation = os.path.join(self.stepSpace.taskSpace.location, step)
+            # Analysis files only come from the cmsRun job reports, skip
+            # unpickling the reports of any other step type
+            stepHelper = self.task.getStep(step)
+            if stepHelper is not None and stepHelper.stepType() != "CMSSW":
+                continue
+            stepLocation = os.path.join(taskLocation, step)
             logging.info("Beginning report processing for step %s", step)
             reportLocation = os.path.join(stepLocation, 'Report.pkl')
-            if not os.path.isfile(reportLocation):
-                logging.error("Cannot find report for step %s in space %s", step, stepLocation)
-                continue
 
-            # First, get everything from a file and 'unpersist' it
+            # First, get everything from a file and 'unpersist' it. A missing
+            # report shows up when opening it, no need to stat it beforehand
             stepReport = Report()
-            stepReport.unpersist(reportLocation, step)
+            try:
+                stepReport.unpersist(reportLocation, step)
+            except IOError:
+                logging.error("Cannot find report for step %s in space %s", step, stepLocation)
+                continue
 
             # Don't upload nor stage out files from bad steps.
             if not stepReport.stepSuccessful(step):
@@ -89,13 +165,28 @@ class DQMUpload(Executor):
             for analysisFile in analysisFiles:
                 # only deal with DQM files
                 if analysisFile.FileClass == "DQM":
-                    # uploading file to the server
-                    self.httpPost(os.path.join(stepLocation,
-                                               os.path.basename(analysisFile.fileName)))
+                    dqmFiles.append(os.path.join(stepLocation,
+                                                 os.path.basename(analysisFile.fileName)))
 
-            # Am DONE with report
-            # Persist it
-            stepReport.persist(reportLocation)
+        # Build the url openers upfront, to fail fast on a broken proxy
+        # and to share them among the concurrent uploads below
+        if dqmFiles:
+            for uploadURL in self.step.upload.URL.split(';'):
+                self.getOpener(uploadURL)
+
+        # uploading files to the server. Uploads are network bound, so a few
+        # of them are run concurrently when there are several files
+        if len(dqmFiles) > 1:
+            pool = ThreadPool(min(len(dqmFiles), MAX_CONCURRENT_UPLOADS))
+            try:
+                # raises the first failure, if any
+                pool.map(self.httpPost, dqmFiles)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for dqmFile in dqmFiles:
+                self.httpPost(dqmFile)
 
         return
 
@@ -106,10 +197,6 @@ class DQMUpload(Executor):
         Post execution checkpointing
 
         """
-        # Another emulator check
-        if emulator is not None:
-            return emulator.emulatePost(self.step)
-
         logging.info("Steps.Executors.DQMUpload.post called")
         return None
 
@@ -126,80 +213,93 @@ class DQMUpload(Executor):
         """
         args = {}
 
-        # Preparing a checksum
-        blockSize = 0x10000
-
-        def upd(m, data):
-            m.update(data)
-            return m
+        # The file is opened only once: it's first read to compute its checksum,
+        # which goes in the form fields preceding the file contents, then it's
+        # rewound and streamed to every upload URL
+        with io.open(filename, 'rb', buffering=0) as fd:
+            args['size'] = os.fstat(fd.fileno()).st_size
+
+            # Preparing a checksum. Files up to MAX_MMAP_CHECKSUM_SIZE are hashed
+            # straight from a memory map, without copying them to a user buffer,
+            # bigger ones are read in 1MB blocks into a reusable buffer
+            m = md5()
+            if 0 < args['size'] <= MAX_MMAP_CHECKSUM_SIZE:
+                fileMap = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    m.update(fileMap)
+                finally:
+                    fileMap.close()
+            else:
+                buf = bytearray(0x100000)
+                view = memoryview(buf)
+                while True:
+                    nBytes = fd.readinto(buf)
+                    if not nBytes:
+                        break
+                    m.update(view[:nBytes])
+
+            args['checksum'] = 'md5:%s' % m.hexdigest()
+            # args['checksum'] = 'md5:%s' % md5.new(filename).read()).hexdigest()
+
+            uploadURLs = self.step.upload.URL
+            logging.info("HTTP Upload is about to start:\n => URL: %s\n => Filename: %s\n",
+                         uploadURLs, filename)
 
-        fd = open(filename, 'rb')
-        try:
-            contents = iter(lambda: fd.read(blockSize), '')
-            m = reduce(upd, contents, md5())
-        finally:
-            fd.close()
-
-        args['checksum'] = 'md5:%s' % m.hexdigest()
-        # args['checksum'] = 'md5:%s' % md5.new(filename).read()).hexdigest()
-        args['size'] = os.path.getsize(filename)
-
-        msg = "HTTP Upload is about to start:\n"
-        msg += " => URL: %s\n" % self.step.upload.URL
-        msg += " => Filename: %s\n" % filename
-        logging.info(msg)
-
-        try:
-            for uploadURL in self.step.upload.URL.split(';'):
-                (headers, data) = self.upload(uploadURL, args, filename)
-                msg = 'HTTP upload finished succesfully with response:\n'
-                msg += 'Status code: %s\n' % headers.get("Dqm-Status-Code", None)
-                msg += 'Message: %s\n' % headers.get("Dqm-Status-Message", None)
-                msg += 'Detail: %s\n' % headers.get("Dqm-Status-Detail", None)
-                msg += 'Data: %s\n' % str(data)
-                logging.info(msg)
-        except urllib2.HTTPError as ex:
-            msg = 'HTTP upload failed with response:\n'
-            msg += 'Status code: %s\n' % ex.hdrs.get("Dqm-Status-Code", None)
-            msg += 'Message: %s\n' % ex.hdrs.get("Dqm-Status-Message", None)
-            msg += 'Detail: %s\n' % ex.hdrs.get("Dqm-Status-Detail", None)
-            msg += 'Error: %s\n' % str(ex)
-            logging.exception(msg)
-            raise WMExecutionFailure(70318, "DQMUploadFailure", msg)
-        except Exception as ex:
-            msg = 'HTTP upload failed with response:\n'
-            msg += 'Problem unknown.\n'
-            msg += 'Error: %s\n' % str(ex)
-            logging.exception(msg)
-            raise WMExecutionFailure(70318, "DQMUploadFailure", msg)
+            try:
+                for uploadURL in uploadURLs.split(';'):
+                    (headers, data) = self.upload(uploadURL, args, filename, fd)
+                    logging.info("HTTP upload finished succesfully with response:\n"
+                                 "Status code: %s\nMessage: %s\nDetail: %s\nData: %s\n",
+                                 headers.get("Dqm-Status-Code", None),
+                                 headers.get("Dqm-Status-Message", None),
+                                 headers.get("Dqm-Status-Detail", None), data)
+            except urllib2.HTTPError as ex:
+                msg = 'HTTP upload failed with response:\n'
+                msg += 'Status code: %s\nMessage: %s\nDetail: %s\nError: %s\n' % (
+                    ex.hdrs.get("Dqm-Status-Code", None), ex.hdrs.get("Dqm-Status-Message", None),
+                    ex.hdrs.get("Dqm-Status-Detail", None), str(ex))
+                logging.exception(msg)
+                raise WMExecutionFailure(70318, "DQMUploadFailure", msg)
+            except Exception as ex:
+                msg = 'HTTP upload failed with response:\nProblem unknown.\nError: %s\n' % str(ex)
+                logging.exception(msg)
+                raise WMExecutionFailure(70318, "DQMUploadFailure", msg)
 
         return
 
     def filetype(self, filename):
-        return guess_type(filename)[0] or 'application/octet-stream'
+        ext = os.path.splitext(filename)[1]
+        if ext not in _MIME_TYPES:
+            _MIME_TYPES[ext] = guess_type('file' + ext)[0] or 'application/octet-stream'
+        return _MIME_TYPES[ext]
 
     def encode(self, args, files):
         """
-        Encode form (name, value) and (name, filename, type) elements into
+        Encode form (name, value) and (name, (filename, fileobj, size)) elements into
         multi-part/form-data. We don't actually need to know what we are
         uploading here, so just claim it's all text/plain.
+
+        The body is returned as a MultipartBody, such that the file contents
+        are streamed from the (rewound) file objects while sending instead of
+        being loaded in memory.
         """
-        boundary = '----------=_DQM_FILE_BOUNDARY_=-----------'
-        (body, crlf) = ('', '\r\n')
+        # form framing fragments, joined into a single string whenever a file is added
+        (text, parts) = ([], [])
         for (key, value) in args.items():
-            payload = str(value)
-            body += '--' + boundary + crlf
-            body += ('Content-Disposition: form-data; name="%s"' % key) + crlf
-            body += crlf + payload + crlf
-        for (key, filename) in files.items():
-            body += '--' + boundary + crlf
-            body += ('Content-Disposition: form-data; name="%s"; filename="%s"'
-                     % (key, os.path.basename(filename))) + crlf
-            body += ('Content-Type: %s' % self.filetype(filename)) + crlf
-            body += ('Content-Length: %d' % os.path.getsize(filename)) + crlf
-            body += crlf + open(filename, "r").read() + crlf
-            body += '--' + boundary + '--' + crlf + crlf
-        return ('multipart/form-data; boundary=' + boundary, body)
+            text.extend([_BOUNDARY_LINE,
+                         'Content-Disposition: form-data; name="%s"\r\n\r\n' % key,
+                         str(value), _CRLF])
+        for (key, (filename, fileobj, size)) in files.items():
+            text.extend([_BOUNDARY_LINE,
+                         'Content-Disposition: form-data; name="%s"; filename="%s"\r\n'
+                         % (key, os.path.basename(filename)),
+                         'Content-Type: %s\r\n' % self.filetype(filename),
+                         'Content-Length: %d\r\n\r\n' % size])
+            fileobj.seek(0)
+            parts.extend([''.join(text), (fileobj, size)])
+            text = [_END_BOUNDARY]
+        parts.append(''.join(text))
+        return (_CONTENT_TYPE, MultipartBody(parts))
 
     def marshall(self, args, files, request):
         """
@@ -214,41 +314,71 @@ class DQMUpload(Executor):
         request.add_data(body)
         return
 
-    def upload(self, url, args, filename):
+    def getOpener(self, url):
+        """
+        _getOpener_
+
+        Return the url opener to be used for the given upload url. Openers
+        are built only once, such that the proxy certificate is loaded once
+        per executor instead of once per uploaded file and url.
+        Raise a WMExecutionFailure if the proxy can't be used.
+        """
+        useHTTPS = 'https://' in url
+        if useHTTPS not in self.openers:
+            uploadProxy = self.step.upload.proxy or os.environ.get('X509_USER_PROXY', None)
+            logging.info("Using proxy file: %s", uploadProxy)
+            logging.info("Using CA certificate path: %s", os.environ.get('X509_CERT_DIR'))
+            if useHTTPS and not (uploadProxy and os.path.isfile(uploadProxy)):
+                msg = "Proxy file for the HTTPS upload not found: %s" % uploadProxy
+                raise WMExecutionFailure(70318, "DQMUploadFailure", msg)
+
+            try:
+                handler = HTTPSAuthHandler(key=uploadProxy, cert=uploadProxy)
+            except Exception as ex:
+                msg = "Failed to load the proxy file %s: %s" % (uploadProxy, str(ex))
+                raise WMExecutionFailure(70318, "DQMUploadFailure", msg)
+            opener = urllib2.OpenerDirector()
+            opener.add_handler(handler)
+            if not useHTTPS:
+                opener.add_handler(urllib2.ProxyHandler({}))
+            self.openers[useHTTPS] = opener
+        return self.openers[useHTTPS]
+
+    def upload(self, url, args, filename, fileobj):
         """
         _upload_
 
         Perform a file upload to the dqm server using HTTPS auth with the
-        service proxy provided
+        service proxy provided. The contents are read from fileobj, which
+        is left open.
         """
         ident = "WMAgent python/%d.%d.%d" % sys.version_info[:3]
-        uploadProxy = self.step.upload.proxy or os.environ.get('X509_USER_PROXY', None)
-        logging.info("Using proxy file: %s", uploadProxy)
-        logging.info("Using CA certificate path: %s", os.environ.get('X509_CERT_DIR'))
-
-        msg = "HTTP POST upload arguments:\n"
-        for arg in args:
-            msg += "  ==> %s: %s\n" % (arg, args[arg])
-        logging.info(msg)
 
-        handler = HTTPSAuthHandler(key=uploadProxy, cert=uploadProxy)
-        opener = urllib2.OpenerDirector()
-        opener.add_handler(handler)
+        if logging.getLogger().isEnabledFor(logging.INFO):
+            logging.info("HTTP POST upload arguments:\n%s",
+                         "".join("  ==> %s: %s\n" % item for item in args.items()))
 
         # setup the request object
         datareq = urllib2.Request(url + '/data/put')
         datareq.add_header('Accept-encoding', 'gzip')
         datareq.add_header('User-agent', ident)
-        self.marshall(args, {'file': filename}, datareq)
+        self.marshall(args, {'file': (filename, fileobj, args['size'])}, datareq)
 
-        if 'https://' in url:
-            result = opener.open(datareq)
-        else:
-            opener.add_handler(urllib2.ProxyHandler({}))
-            result = opener.open(datareq)
+        result = self.getOpener(url).open(datareq)
 
-        data = result.read()
         if result.headers.get('Content-encoding', '') == 'gzip':
-            data = GzipFile(fileobj=StringIO(data)).read()
+            # decompress while reading, without an intermediate copy of the
+            # compressed response (GzipFile needs a seekable file object)
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunks = []
+            while True:
+                chunk = result.read(0x10000)
+                if not chunk:
+                    break
+                chunks.append(decompressor.decompress(chunk))
+            chunks.append(decompressor.flush())
+            data = ''.join(chunks)
+        else:
+            data = result.read()
 
         return (result.headers, data)
@@ -27,6 +27,8 @@ class DataCache(object):
     def setlatestJobData(jobData):
         DataCache._lastedActiveDataFromAgent["time"] = int(time.time())
         DataCache._lastedActiveDataFromAgent["data"] = jobData
+        # parsed OutputDatasets, filled by getProtectedLFNs and valid for this data only
+        DataCache._lastedActiveDataFromAgent["outputDatasetParts"] = {}
 
     @staticmethod
     def islatestJobDataExpired():
@@ -78,7 +80,8 @@ class DataCache(object):
     @staticmethod
     def getProtectedLFNs():
         reqData = DataCache.getlatestJobData()
+        datasetParts = DataCache._lastedActiveDataFromAgent.get("outputDatasetParts")
 
         for _, reqInfo in reqData.iteritems():
-            for dirPath in protectedLFNs(reqInfo):
+            for dirPath in protectedLFNs(reqInfo, datasetParts):
                 yield dirPath
\ No newline at end of file
@@ -67,6 +67,14 @@ class CouchWorkQueueElement(WorkQueueElement):
         Load the document representing this WQE
         """
         document = self._couch.document(self._document['_id'])
+        return self.loadDocument(document)
+
+    def loadDocument(self, document):
+        """
+        _loadDocument_
+
+        Update this WQE from an already retrieved couch document
+        """
         self.update(document.pop('WMCore.WorkQueue.DataStructs.WorkQueueElement.WorkQueueElement'))
         self._document['_rev'] = document.pop('_rev')
         self._document['timestamp'] = document.pop('timestamp', None)
@@ -59,19 +59,23 @@ def getGlobalSiteStatusSummary(elements, status=None, dataLocality=False):
                 commonSites = ['NoPossibleSite']
                 jobsPerSite = elem['Jobs']
 
+            # same job counts for all the sites of this element
+            uniqueJobsCount = ceil(jobsPerSite)
+            possibleJobsCount = ceil(elem['Jobs'])
             for site in commonSites:
-                uniqueJobs.setdefault(site, {'Jobs': 0, 'NumElems': 0, 'site_name': site})
-                possibleJobs.setdefault(site, {'Jobs': 0, 'NumElems': 0, 'site_name': site})
-
-                uniqueJobs[site]['Jobs'] += ceil(jobsPerSite)
-                uniqueJobs[site]['NumElems'] += 1
-                possibleJobs[site]['Jobs'] += ceil(elem['Jobs'])
-                possibleJobs[site]['NumElems'] += 1
+                if site not in uniqueJobs:
+                    uniqueJobs[site] = {'Jobs': 0, 'NumElems': 0, 'site_name': site}
+                    possibleJobs[site] = {'Jobs': 0, 'NumElems': 0, 'site_name': site}
+
+                siteSummary = uniqueJobs[site]
+                siteSummary['Jobs'] += uniqueJobsCount
+                siteSummary['NumElems'] += 1
+                siteSummary = possibleJobs[site]
+                siteSummary['Jobs'] += possibleJobsCount
+                siteSummary['NumElems'] += 1
         # now make it a list of dicts to be elastic search friendly
-        for site in uniqueJobs:
-            uniqueJobsSummary[st].append(uniqueJobs[site])
-        for site in possibleJobs:
-            possibleJobsSummary[st].append(possibleJobs[site])
+        uniqueJobsSummary[st].extend(uniqueJobs.values())
+        possibleJobsSummary[st].extend(possibleJobs.values())
 
     return uniqueJobsSummary, possibleJobsSummary
 
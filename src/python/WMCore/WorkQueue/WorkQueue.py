@@ -12,12 +12,15 @@ https://twiki.cern.ch/twiki/bin/view/CMS/WMCoreJobPool
 
 from __future__ import division, print_function
 
+import logging
 import os
 import threading
 import time
 import traceback
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from operator import itemgetter
 
+from Utils.IteratorTools import grouper
 from WMCore import Lexicon
 from WMCore.ACDC.DataCollectionService import DataCollectionService
 from WMCore.Alerts import API as alertAPI
@@ -40,6 +43,44 @@ from WMCore.WorkQueue.WorkQueueExceptions import (TERMINAL_EXCEPTIONS, WorkQueue
                                                   WorkQueueWMSpecError)
 from WMCore.WorkQueue.WorkQueueUtils import cmsSiteNames, get_dbs
 
+# default values of the WorkQueue parameters (immutable ones only)
+_WORKQUEUE_DEFAULTS = {'DbName': 'workqueue',
+                       'ParentQueueCouchUrl': None,  # We get work from here
+                       'GlobalDBS': "https://cmsweb.cern.ch/dbs/prod/global/DBSReader",
+                       'QueueDepth': 1,  # when less than this locally
+                       'WorkPerCycle': 100,
+                       'LocationRefreshInterval': 600,
+                       'FullLocationRefreshInterval': 7200,
+                       'TrackLocationOrSubscription': 'location',
+                       'ReleaseIncompleteBlocks': False,
+                       'ReleaseRequireSubscribed': True,
+                       'PhEDExEndpoint': None,
+                       'PopulateFilesets': True,
+                       'LocalQueueFlag': True,
+                       'QueueRetryTime': 86400,
+                       'stuckElementAlertTime': 172800,
+                       'reqmgrCompleteGraceTime': 604800,
+                       'cancelGraceTime': 86400,
+                       'CloseWorkBatchSize': 200,  # open inbox elements loaded at a time in closeWork
+                       'CloseWorkSpecChunkSize': 10,  # specs loaded at a time in closeWork
+                       'JobDumpConfig': None,
+                       'BossAirConfig': None,
+                       'WMBSUrl': None  # this will only be set on local Queue
+                      }
+
+# request statuses for which the workflow elements can be deleted
+_DELETABLE_STATES = frozenset(["completed", "closed-out", "failed",
+                               "announced", "aborted-completed", "rejected",
+                               "normal-archived", "aborted-archived", "rejected-archived"])
+
+
+def _groupBy(items, key):
+    """Group the items in a dict of lists by the value of their key"""
+    grouped = {}
+    for item in items:
+        grouped.setdefault(item[key], []).append(item)
+    return grouped
+
 
 # Convenience constructor functions
 
@@ -77,7 +118,8 @@ class WorkQueue(WorkQueueBase):
 
         WorkQueueBase.__init__(self, logger, dbi)
         self.parent_queue = None
-        self.params = params
+        self.params = dict(_WORKQUEUE_DEFAULTS)
+        self.params.update(params)
 
         # config argument (within params) shall be reference to
         # Configuration instance (will later be checked for presence of "Alert")
@@ -85,9 +127,7 @@ class WorkQueue(WorkQueueBase):
         self.params.setdefault('CouchUrl', os.environ.get('COUCHURL'))
         if not self.params.get('CouchUrl'):
             raise RuntimeError('CouchUrl config value mandatory')
-        self.params.setdefault('DbName', 'workqueue')
         self.params.setdefault('InboxDbName', self.params['DbName'] + '_inbox')
-        self.params.setdefault('ParentQueueCouchUrl', None)  # We get work from here
 
         self.backend = WorkQueueBackend(self.params['CouchUrl'], self.params['DbName'],
                                         self.params['InboxDbName'],
@@ -114,29 +154,8 @@ class WorkQueue(WorkQueueBase):
                 raise WorkQueueError(msg)
             self.params['ParentQueueCouchUrl'] = self.parent_queue.queueUrl
 
-        self.params.setdefault("GlobalDBS",
-                               "https://cmsweb.cern.ch/dbs/prod/global/DBSReader")
-        self.params.setdefault('QueueDepth', 1)  # when less than this locally
-        self.params.setdefault('WorkPerCycle', 100)
-        self.params.setdefault('LocationRefreshInterval', 600)
-        self.params.setdefault('FullLocationRefreshInterval', 7200)
-        self.params.setdefault('TrackLocationOrSubscription', 'location')
-        self.params.setdefault('ReleaseIncompleteBlocks', False)
-        self.params.setdefault('ReleaseRequireSubscribed', True)
-        self.params.setdefault('PhEDExEndpoint', None)
-        self.params.setdefault('PopulateFilesets', True)
-        self.params.setdefault('LocalQueueFlag', True)
-        self.params.setdefault('QueueRetryTime', 86400)
-        self.params.setdefault('stuckElementAlertTime', 172800)
-        self.params.setdefault('reqmgrCompleteGraceTime', 604800)
-        self.params.setdefault('cancelGraceTime', 86400)
-
-        self.params.setdefault('JobDumpConfig', None)
-        self.params.setdefault('BossAirConfig', None)
-
         self.params['QueueURL'] = self.backend.queueUrl  # url this queue is visible on
         # backend took previous QueueURL and sanitized it
-        self.params.setdefault('WMBSUrl', None)  # this will only be set on local Queue
         if self.params.get('WMBSUrl'):
             self.params['WMBSUrl'] = Lexicon.sanitizeURL(self.params['WMBSUrl'])['url']
         self.params.setdefault('Teams', [])
@@ -149,61 +168,30 @@ class WorkQueue(WorkQueueBase):
         elif self.params.get('PopulateFilesets'):
             raise RuntimeError('CacheDir mandatory for local queue')
 
-        self.params.setdefault('SplittingMapping', {})
-        self.params['SplittingMapping'].setdefault('DatasetBlock',
-                                                   {'name': 'Block',
-                                                    'args': {}}
-                                                  )
-        self.params['SplittingMapping'].setdefault('MonteCarlo',
-                                                   {'name': 'MonteCarlo',
-                                                    'args': {}}
-                                                  )
-        self.params['SplittingMapping'].setdefault('Dataset',
-                                                   {'name': 'Dataset',
-                                                    'args': {}}
-                                                  )
-        self.params['SplittingMapping'].setdefault('Block',
-                                                   {'name': 'Block',
-                                                    'args': {}}
-                                                  )
-        self.params['SplittingMapping'].setdefault('ResubmitBlock',
-                                                   {'name': 'ResubmitBlock',
-                                                    'args': {}}
-                                                  )
+        splittingMapping = self.params.setdefault('SplittingMapping', {})
+        splittingMapping.setdefault('DatasetBlock', {'name': 'Block', 'args': {}})
+        splittingMapping.setdefault('MonteCarlo', {'name': 'MonteCarlo', 'args': {}})
+        splittingMapping.setdefault('Dataset', {'name': 'Dataset', 'args': {}})
+        splittingMapping.setdefault('Block', {'name': 'Block', 'args': {}})
+        splittingMapping.setdefault('ResubmitBlock', {'name': 'ResubmitBlock', 'args': {}})
 
         self.params.setdefault('EndPolicySettings', {})
 
-        assert (self.params['TrackLocationOrSubscription'] in ('subscription',
-                                                               'location'))
+        trackLocationOrSubscription = self.params['TrackLocationOrSubscription']
+        assert (trackLocationOrSubscription in ('subscription', 'location'))
         # Can only release blocks on location
-        if self.params['TrackLocationOrSubscription'] == 'location':
-            if self.params['SplittingMapping']['DatasetBlock']['name'] != 'Block':
+        if trackLocationOrSubscription == 'location':
+            if splittingMapping['DatasetBlock']['name'] != 'Block':
                 raise RuntimeError('Only blocks can be released on location')
 
-        if self.params.get('PhEDEx'):
-            self.phedexService = self.params['PhEDEx']
-        else:
-            phedexArgs = {}
-            if self.params.get('PhEDExEndpoint'):
-                phedexArgs['endpoint'] = self.params['PhEDExEndpoint']
-            self.phedexService = PhEDEx(phedexArgs)
-
-        if self.params.get('SiteDB'):
-            self.SiteDB = self.params['SiteDB']
-        else:
-            self.SiteDB = SiteDB()
-
-        self.dataLocationMapper = WorkQueueDataLocationMapper(self.logger, self.backend,
-                                                              phedex=self.phedexService,
-                                                              sitedb=self.SiteDB,
-                                                              locationFrom=self.params['TrackLocationOrSubscription'],
-                                                              incompleteBlocks=self.params['ReleaseIncompleteBlocks'],
-                                                              requireBlocksSubscribed=not self.params[
-                                                                  'ReleaseIncompleteBlocks'],
-                                                              fullRefreshInterval=self.params[
-                                                                  'FullLocationRefreshInterval'],
-                                                              updateIntervalCoarseness=self.params[
-                                                                  'LocationRefreshInterval'])
+        # PhEDEx, SiteDB, the data location mapper, LogDB and the alerts
+        # client are only created when first used (see the properties below)
+        self._phedexService = None
+        self._siteDB = None
+        self._dataLocationMapper = None
+        self._logdb = None
+        self._alertSender = None
+        self._sendAlert = None
 
         # used for only global WQ
         if self.params.get('ReqMgrServiceURL'):
@@ -214,14 +202,6 @@ class WorkQueue(WorkQueueBase):
             # TODO: Change ReqMgr api to accept post for for retrieving the data and remove this
             self.requestDB = RequestDBReader(self.params['RequestDBURL'])
 
-        # initialize alerts sending client (self.sendAlert() method)
-        # usage: self.sendAlert(levelNum, msg = msg) ; level - integer 1 .. 10
-        #    1 - 4 - lower levels ; 5 - 10 higher levels
-        preAlert, self.alertSender = \
-            alertAPI.setUpAlertsMessaging(self, compName="WorkQueueManager")
-        self.sendAlert = alertAPI.getSendAlert(sender=self.alertSender,
-                                               preAlert=preAlert)
-
         # set the thread name before create the log db.
         # only sets that when it is not set already
         # setLogDB
@@ -229,13 +209,69 @@ class WorkQueue(WorkQueueBase):
         myThread = threading.currentThread()
         if myThread.getName() == "MainThread":  # this should be only GQ case other cases thread name should be set
             myThread.setName(self.__class__.__name__)
-
-        centralurl = self.params.get("central_logdb_url")
-        identifier = self.params.get("log_reporter")
-        self.logdb = LogDB(centralurl, identifier, logger=self.logger)
+        # log db is created later on, possibly from another thread
+        self._logdbThreadName = myThread.getName()
 
         self.logger.debug("WorkQueue created successfully")
 
+    @property
+    def phedexService(self):
+        """PhEDEx service, created on first use"""
+        if self._phedexService is None:
+            if self.params.get('PhEDEx'):
+                self._phedexService = self.params['PhEDEx']
+            else:
+                phedexArgs = {}
+                if self.params.get('PhEDExEndpoint'):
+                    phedexArgs['endpoint'] = self.params['PhEDExEndpoint']
+                self._phedexService = PhEDEx(phedexArgs)
+        return self._phedexService
+
+    @property
+    def SiteDB(self):
+        """SiteDB service, created on first use"""
+        if self._siteDB is None:
+            self._siteDB = self.params.get('SiteDB') or SiteDB()
+        return self._siteDB
+
+    @property
+    def dataLocationMapper(self):
+        """Data location mapper, created on first use"""
+        if self._dataLocationMapper is None:
+            self._dataLocationMapper = WorkQueueDataLocationMapper(
+                self.logger, self.backend,
+                phedex=self.phedexService,
+                sitedb=self.SiteDB,
+                locationFrom=self.params['TrackLocationOrSubscription'],
+                incompleteBlocks=self.params['ReleaseIncompleteBlocks'],
+                requireBlocksSubscribed=not self.params['ReleaseIncompleteBlocks'],
+                fullRefreshInterval=self.params['FullLocationRefreshInterval'],
+                updateIntervalCoarseness=self.params['LocationRefreshInterval'])
+        return self._dataLocationMapper
+
+    @property
+    def logdb(self):
+        """LogDB client, created on first use"""
+        if self._logdb is None:
+            centralurl = self.params.get("central_logdb_url")
+            identifier = self.params.get("log_reporter")
+            self._logdb = LogDB(centralurl, identifier, logger=self.logger, thread_name=self._logdbThreadName)
+        return self._logdb
+
+    @property
+    def sendAlert(self):
+        """
+        Alerts sending client, set up on first use
+        usage: self.sendAlert(levelNum, msg = msg) ; level - integer 1 .. 10
+           1 - 4 - lower levels ; 5 - 10 higher levels
+        """
+        if self._sendAlert is None:
+            preAlert, self._alertSender = \
+                alertAPI.setUpAlertsMessaging(self, compName="WorkQueueManager")
+            self._sendAlert = alertAPI.getSendAlert(sender=self._alertSender,
+                                                    preAlert=preAlert)
+        return self._sendAlert
+
     def __len__(self):
         """Returns number of Available elements in queue"""
         return self.backend.queueLength()
@@ -246,8 +282,8 @@ class WorkQueue(WorkQueueBase):
         The registration happened in the constructor when initializing.
 
         """
-        if self.alertSender:
-            self.alertSender.unregister()
+        if getattr(self, '_alertSender', None):
+            self._alertSender.unregister()
 
     def setStatus(self, status, elementIDs=None, SubscriptionId=None, WorkflowName=None):
         """
@@ -339,46 +375,48 @@ class WorkQueue(WorkQueueBase):
         if not matches:
             return results
 
-        # cache wmspecs for lifetime of function call, likely we will have multiple elements for same spec.
+        # likely we will have multiple elements for same spec, group the matches
+        # by workflow so each wmspec is only loaded once per call.
         # TODO: Check to see if we can skip spec loading - need to persist some more details to element
-        wmspecCache = {}
+        matchesByRequest = OrderedDict()
         for match in matches:
-            blockName, dbsBlock = None, None
-            if self.params['PopulateFilesets']:
-                if match['RequestName'] not in wmspecCache:
-                    wmspec = self.backend.getWMSpec(match['RequestName'])
-                    wmspecCache[match['RequestName']] = wmspec
-                else:
-                    wmspec = wmspecCache[match['RequestName']]
-
-                try:
-                    if match['StartPolicy'] == 'Dataset':
-                        # actually returns dataset name and dataset info
-                        blockName, dbsBlock = self._getDBSDataset(match)
-                    elif match['Inputs']:
-                        blockName, dbsBlock = self._getDBSBlock(match, wmspec)
-                except Exception as ex:
-                    msg = "%s, %s: \n" % (wmspec.name(), match['Inputs'].keys())
-                    msg += "failed to retrieve data from DBS/PhEDEx in LQ: \n%s" % str(ex)
-                    self.logger.error(msg)
-                    self.logdb.post(wmspec.name(), msg, 'error')
-                    continue
+            matchesByRequest.setdefault(match['RequestName'], []).append(match)
+
+        populateFilesets = self.params['PopulateFilesets']
+        for requestName, requestMatches in matchesByRequest.items():
+            if populateFilesets:
+                wmspec = self.backend.getWMSpec(requestName)
+                blockLocations = self._getDBSBlockLocations(requestMatches, wmspec)
+            for match in requestMatches:
+                blockName, dbsBlock = None, None
+                if populateFilesets:
+                    try:
+                        if match['StartPolicy'] == 'Dataset':
+                            # actually returns dataset name and dataset info
+                            blockName, dbsBlock = self._getDBSDataset(match)
+                        elif match['Inputs']:
+                            blockName, dbsBlock = self._getDBSBlock(match, wmspec, blockLocations)
+                    except Exception as ex:
+                        msg = "%s, %s: \n" % (wmspec.name(), list(match['Inputs']))
+                        msg += "failed to retrieve data from DBS/PhEDEx in LQ: \n%s" % str(ex)
+                        self.logger.error(msg)
+                        self.logdb.post(wmspec.name(), msg, 'error')
+                        continue
 
-                try:
-                    match['Subscription'] = self._wmbsPreparation(match,
-                                                                  wmspec,
-                                                                  blockName,
-                                                                  dbsBlock)
-                    self.logdb.delete(wmspec.name(), "error", this_thread=True)
-                except Exception as ex:
-                    msg = "%s, %s: \ncreating subscription failed in LQ: \n%s" % (wmspec.name(), blockName, str(ex))
-                    self.logger.exception(msg)
-                    self.logdb.post(wmspec.name(), msg, 'error')
-                    continue
+                    try:
+                        match['Subscription'] = self._wmbsPreparation(match,
+                                                                      wmspec,
+                                                                      blockName,
+                                                                      dbsBlock)
+                        self.logdb.delete(wmspec.name(), "error", this_thread=True)
+                    except Exception as ex:
+                        msg = "%s, %s: \ncreating subscription failed in LQ: \n%s" % (wmspec.name(), blockName, str(ex))
+                        self.logger.exception(msg)
+                        self.logdb.post(wmspec.name(), msg, 'error')
+                        continue
 
-            results.append(match)
+                results.append(match)
 
-        del wmspecCache  # remove cache explicitly
         self.logger.info('Injected %s units into WMBS' % len(results))
         return results
 
@@ -386,23 +424,52 @@ class WorkQueue(WorkQueueBase):
         """Get DBS info for this dataset"""
         tmpDsetDict = {}
         dbs = get_dbs(match['Dbs'])
-        datasetName = match['Inputs'].keys()[0]
+        datasetName = next(iter(match['Inputs']))
 
         blocks = dbs.listFileBlocks(datasetName, onlyClosedBlocks=True)
+        # blocks were just listed as closed, so don't check their existence and status
+        # again like getFileBlock does, and get all their locations in a single call
+        blockLocations = dbs.listFileBlockLocation(blocks) if blocks else {}
         for blockName in blocks:
-            tmpDsetDict.update(dbs.getFileBlock(blockName))
+            tmpDsetDict[blockName] = {'PhEDExNodeNames': blockLocations[blockName],
+                                      'Files': dbs.listFilesInBlock(blockName),
+                                      'IsOpen': False}
 
-        dbsDatasetDict = {'Files': [], 'IsOpen': False, 'PhEDExNodeNames': []}
-        dbsDatasetDict['Files'] = [f for block in tmpDsetDict.values() for f in block['Files']]
-        dbsDatasetDict['PhEDExNodeNames'].extend(
-            [f for block in tmpDsetDict.values() for f in block['PhEDExNodeNames']])
-        dbsDatasetDict['PhEDExNodeNames'] = list(set(dbsDatasetDict['PhEDExNodeNames']))
+        files, nodes = [], set()
+        for block in tmpDsetDict.values():
+            files.extend(block['Files'])
+            nodes.update(block['PhEDExNodeNames'])
+        dbsDatasetDict = {'Files': files, 'IsOpen': False, 'PhEDExNodeNames': list(nodes)}
 
         return datasetName, dbsDatasetDict
 
-    def _getDBSBlock(self, match, wmspec):
+    def _getDBSBlockLocations(self, matches, wmspec):
+        """
+        Look up the locations of the input blocks of a workflow in a single
+        PhEDEx call per DBS instance, instead of one call per block.
+        Returns an empty dict if that fails, so each block is looked up on its own.
+        """
+        if wmspec.requestType() == 'StoreResults':
+            # locations come from DBS, which is queried block by block anyway
+            return {}
+
+        blocksByDbs = defaultdict(set)
+        for match in matches:
+            if match['StartPolicy'] != 'Dataset' and match['Inputs'] and not match['ACDC']:
+                blocksByDbs[match['Dbs']].add(next(iter(match['Inputs'])))
+
+        locations = {}
+        for dbsUrl, blocks in blocksByDbs.items():
+            try:
+                locations.update(get_dbs(dbsUrl).listFileBlockLocation(list(blocks)))
+            except Exception as ex:
+                self.logger.warning("Failed to get the location of %s blocks in bulk, will try one by one: %s",
+                                    len(blocks), str(ex))
+        return locations
+
+    def _getDBSBlock(self, match, wmspec, blockLocations=None):
         """Get DBS info for this block"""
-        blockName = match['Inputs'].keys()[0]  # TODO: Allow more than one
+        blockName = next(iter(match['Inputs']))  # TODO: Allow more than one
 
         if match['ACDC']:
             acdcInfo = match['ACDC']
@@ -418,17 +485,19 @@ class WorkQueue(WorkQueueBase):
             return blockName, block
         else:
             dbs = get_dbs(match['Dbs'])
+            locations = (blockLocations or {}).get(blockName)
             if wmspec.getTask(match['TaskName']).parentProcessingFlag():
-                dbsBlockDict = dbs.getFileBlockWithParents(blockName)
+                dbsBlockDict = dbs.getFileBlockWithParents(blockName, locations=locations)
             elif wmspec.requestType() == 'StoreResults':
                 dbsBlockDict = dbs.getFileBlock(blockName, dbsOnly=True)
             else:
-                dbsBlockDict = dbs.getFileBlock(blockName)
+                dbsBlockDict = dbs.getFileBlock(blockName, locations=locations)
 
         return blockName, dbsBlockDict[blockName]
 
     def _wmbsPreparation(self, match, wmspec, blockName, dbsBlock):
         """Inject data into wmbs and create subscription. """
+        # import inside function since GQ doesn't need this.
         from WMCore.WorkQueue.WMBSHelper import WMBSHelper
         self.logger.info("Adding WMBS subscription for %s" % match['RequestName'])
 
@@ -453,36 +522,43 @@ class WorkQueue(WorkQueueBase):
             Assumes elements are from the same workflow"""
         if not self.params['LocalQueueFlag']:
             return
-        wmspec = None
+        elements = [ele for ele in elements if ele and ele.isRunning() and ele['SubscriptionId'] and
+                    ele['Inputs'] and ele['OpenForNewData'] and ele['StartPolicy'] != 'Dataset']
+        if not elements:
+            return
+        # import inside function since GQ doesn't need this.
+        from WMCore.WorkQueue.WMBSHelper import WMBSHelper
+        wmspec = self.backend.getWMSpec(elements[0]['RequestName'])
+        blockLocations = self._getDBSBlockLocations(elements, wmspec)
+        cacheDir = self.params['CacheDir']
+        logInfo = self.logger.info
+        updateElements = self.backend.updateElements
+        updateInboxElements = self.backend.updateInboxElements
         for ele in elements:
-            if not ele.isRunning() or not ele['SubscriptionId'] or not ele:
-                continue
-            if not ele['Inputs'] or not ele['OpenForNewData'] or ele['StartPolicy'] == 'Dataset':
-                continue
-            if not wmspec:
-                wmspec = self.backend.getWMSpec(ele['RequestName'])
-            blockName, dbsBlock = self._getDBSBlock(ele, wmspec)
+            blockName, dbsBlock = self._getDBSBlock(ele, wmspec, blockLocations)
             if ele['NumOfFilesAdded'] != len(dbsBlock['Files']):
-                self.logger.info("Adding new files to open block %s (%s)" % (blockName, ele.id))
-                from WMCore.WorkQueue.WMBSHelper import WMBSHelper
-                wmbsHelper = WMBSHelper(wmspec, ele['TaskName'], blockName, ele['Mask'], self.params['CacheDir'])
+                logInfo("Adding new files to open block %s (%s)" % (blockName, ele.id))
+                wmbsHelper = WMBSHelper(wmspec, ele['TaskName'], blockName, ele['Mask'], cacheDir)
                 ele['NumOfFilesAdded'] += wmbsHelper.createSubscriptionAndAddFiles(block=dbsBlock)[1]
-                self.backend.updateElements(ele.id, NumOfFilesAdded=ele['NumOfFilesAdded'])
+                updateElements(ele.id, NumOfFilesAdded=ele['NumOfFilesAdded'])
             if dbsBlock['IsOpen'] != ele['OpenForNewData']:
-                self.logger.info("Closing open block %s (%s)" % (blockName, ele.id))
-                self.backend.updateInboxElements(ele['ParentQueueId'], OpenForNewData=dbsBlock['IsOpen'])
-                self.backend.updateElements(ele.id, OpenForNewData=dbsBlock['IsOpen'])
+                logInfo("Closing open block %s (%s)" % (blockName, ele.id))
+                updateInboxElements(ele['ParentQueueId'], OpenForNewData=dbsBlock['IsOpen'])
+                updateElements(ele.id, OpenForNewData=dbsBlock['IsOpen'])
                 ele['OpenForNewData'] = dbsBlock['IsOpen']
 
     def _assignToChildQueue(self, queue, *elements):
         """Assign work from parent to queue"""
+        # elements are saved with their revision, not through the update handler,
+        # so an element acquired meanwhile by another queue fails with a conflict
+        assignment = {'Status': 'Negotiating',
+                      'ChildQueueUrl': queue,
+                      'ParentQueueUrl': self.params['ParentQueueCouchUrl'],
+                      'WMBSUrl': self.params["WMBSUrl"]}
         for ele in elements:
-            ele['Status'] = 'Negotiating'
-            ele['ChildQueueUrl'] = queue
-            ele['ParentQueueUrl'] = self.params['ParentQueueCouchUrl']
-            ele['WMBSUrl'] = self.params["WMBSUrl"]
+            ele.update(assignment)
         work = self.parent_queue.saveElements(*elements)
-        requests = ', '.join(list(set(['"%s"' % x['RequestName'] for x in work])))
+        requests = ', '.join('"%s"' % name for name in {x['RequestName'] for x in work})
         self.logger.info('Acquired work for request(s): %s' % requests)
         return work
 
@@ -494,19 +570,25 @@ class WorkQueue(WorkQueueBase):
                               WorkflowName=WorkflowName)
 
     def killWMBSWorkflow(self, workflow):
+        """Kill a workflow in wmbs, return whether it succeeded"""
+        return not self.killWMBSWorkflows([workflow])
+
+    def killWMBSWorkflows(self, workflows):
+        """Kill workflows in wmbs, return the ones that failed to be killed"""
         # import inside function since GQ doesn't need this.
         from WMCore.WorkQueue.WMBSHelper import killWorkflow
         myThread = threading.currentThread()
         myThread.dbi = self.conn.dbi
         myThread.logger = self.logger
-        success = True
-        try:
-            killWorkflow(workflow, self.params["JobDumpConfig"], self.params["BossAirConfig"])
-        except Exception as ex:
-            success = False
-            self.logger.error('Aborting %s wmbs subscription failed: %s' % (workflow, str(ex)))
-            self.logger.error('It will be retried in the next loop')
-        return success
+        failed = []
+        for workflow in workflows:
+            try:
+                killWorkflow(workflow, self.params["JobDumpConfig"], self.params["BossAirConfig"])
+            except Exception as ex:
+                failed.append(workflow)
+                self.logger.error('Aborting %s wmbs subscription failed: %s' % (workflow, str(ex)))
+                self.logger.error('It will be retried in the next loop')
+        return failed
 
     def cancelWork(self, elementIDs=None, SubscriptionId=None, WorkflowName=None, elements=None):
         """Cancel work - delete in wmbs, delete from workqueue db, set canceled in inbox
@@ -521,12 +603,13 @@ class WorkQueue(WorkQueueBase):
             elements = self.backend.getElements(elementIDs=elementIDs, **args)
 
         # take wf from args in case no elements exist for workflow (i.e. work was negotiating)
-        requestNames = set([x['RequestName'] for x in elements]) | set([wf for wf in [WorkflowName] if wf])
+        requestNames = {x['RequestName'] for x in elements} | {wf for wf in [WorkflowName] if wf}
         if not requestNames:
             return []
+        # the number of workflows is not bounded, query them in batches
         inbox_elements = []
-        for wf in requestNames:
-            inbox_elements.extend(self.backend.getInboxElements(WorkflowName=wf))
+        for names in grouper(requestNames, 100):
+            inbox_elements.extend(self.backend.getInboxElements(WorkflowName=names))
 
         # if local queue, kill jobs, update parent to Canceled and delete elements
         if self.params['LocalQueueFlag']:
@@ -534,31 +617,40 @@ class WorkQueue(WorkQueueBase):
             badWfsCancel = []
             if self.params['PopulateFilesets']:
                 self.logger.info("Canceling work for workflow(s): %s" % (requestNames))
-                for workflow in requestNames:
-                    if not self.killWMBSWorkflow(workflow):
-                        badWfsCancel.append(workflow)
+                badWfsCancel = self.killWMBSWorkflows(requestNames)
             # now we remove any wf that failed to be cancelled (and its inbox elements)
-            requestNames -= set(badWfsCancel)
-            for wf in badWfsCancel:
-                elementsToRemove = self.backend.getInboxElements(WorkflowName=wf)
-                inbox_elements = list(set(inbox_elements) - set(elementsToRemove))
+            if badWfsCancel:
+                badWfsCancel = set(badWfsCancel)
+                requestNames -= badWfsCancel
+                inbox_elements = [x for x in inbox_elements if x['RequestName'] not in badWfsCancel]
             self.logger.info("New list of cancelled requests: %s" % requestNames)
 
             # Don't update as fails sometimes due to conflicts (#3856)
-            for x in inbox_elements:
-                if x['Status'] != 'Canceled':
-                    x.load().__setitem__('Status', 'Canceled')
-
-            self.backend.saveElements(*inbox_elements)
+            self.backend.updateAndSaveElements(*[x for x in inbox_elements if x['Status'] != 'Canceled'],
+                                               Status='Canceled')
 
         # if global queue, update non-acquired to Canceled, update parent to CancelRequested
         else:
-            # Cancel in global if work has not been passed to a child queue
-            elements_to_cancel = [x for x in elements if not x['ChildQueueUrl'] and x['Status'] != 'Canceled']
-            # ensure all elements receive cancel request, covers case where initial cancel request missed some elements
-            # without this elements may avoid the cancel and not be cleared up till they finish
-            elements_not_requested = [x for x in elements if
-                                      x['ChildQueueUrl'] and (x['Status'] != 'CancelRequested' and not x.inEndState())]
+            graceTime = self.params.get('cancelGraceTime', -1)
+            # sort the elements out in a single pass over them
+            elements_to_cancel = []
+            elements_not_requested = []
+            stalled = []
+            last_update = 0
+            for x in elements:
+                if graceTime > 0:
+                    last_update = max(last_update, float(x.updatetime))
+                finished = x.inEndState()
+                if not finished:
+                    stalled.append(x)
+                # Cancel in global if work has not been passed to a child queue
+                if not x['ChildQueueUrl']:
+                    if x['Status'] != 'Canceled':
+                        elements_to_cancel.append(x)
+                # ensure all elements receive cancel request, covers case where initial cancel request missed some
+                # elements without this elements may avoid the cancel and not be cleared up till they finish
+                elif x['Status'] != 'CancelRequested' and not finished:
+                    elements_not_requested.append(x)
 
             self.logger.info("""Canceling work for workflow(s): %s""" % (requestNames))
             if elements_to_cancel:
@@ -567,40 +659,34 @@ class WorkQueue(WorkQueueBase):
 
             if elements_not_requested:
                 # Don't update as fails sometimes due to conflicts (#3856)
-                for x in elements_not_requested:
-                    x.load().__setitem__('Status', 'CancelRequested')
-                self.backend.saveElements(*elements_not_requested)
+                self.backend.updateAndSaveElements(*elements_not_requested, Status='CancelRequested')
                 self.logger.info("CancelRequest-ed element(s) %s" % str([x.id for x in elements_not_requested]))
 
             self.backend.updateInboxElements(
                 *[x.id for x in inbox_elements if x['Status'] != 'CancelRequested' and not x.inEndState()],
                 Status='CancelRequested')
             # if we haven't had any updates for a while assume agent is dead and move to canceled
-            if self.params.get('cancelGraceTime', -1) > 0 and elements:
-                last_update = max([float(x.updatetime) for x in elements])
-                if (time.time() - last_update) > self.params['cancelGraceTime']:
+            if graceTime > 0 and elements:
+                if (time.time() - last_update) > graceTime:
                     self.logger.info("%s cancelation has stalled, mark as finished" % elements[0]['RequestName'])
                     # Don't update as fails sometimes due to conflicts (#3856)
-                    for x in elements:
-                        if not x.inEndState():
-                            x.load().__setitem__('Status', 'Canceled')
-                    self.backend.saveElements(*[x for x in elements if not x.inEndState()])
+                    self.backend.updateAndSaveElements(*stalled, Status='Canceled')
 
         return [x.id for x in elements]
 
     def deleteWorkflows(self, *requests):
         """Delete requests if finished"""
-        for request in requests:
-            request = self.backend.getInboxElements(elementIDs=[request])
-            if len(request) != 1:
-                raise RuntimeError('Invalid number of requests for %s' % request[0]['RequestName'])
-            request = request[0]
-
+        if not requests:
+            return
+        toDelete = []
+        # requests already deleted are skipped
+        for request in self.backend.iterInboxElementsById(requests):
             if request.inEndState():
                 self.logger.info('Deleting request "%s" as it is %s' % (request.id, request['Status']))
-                self.backend.deleteElements(request)
+                toDelete.append(request)
             else:
                 self.logger.debug('Not deleting "%s" as it is %s' % (request.id, request['Status']))
+        self.backend.deleteElements(*toDelete)
 
     def queueWork(self, wmspecUrl, request=None, team=None):
         """
@@ -625,7 +711,10 @@ class WorkQueue(WorkQueueBase):
 
         # Either pull the existing inbox element or create a new one.
         try:
-            inbound = self.backend.getInboxElements(elementIDs=[wmspec.name()], loadSpec=True)
+            inbound = self.backend.getInboxElements(elementIDs=[wmspec.name()])
+            # no need to load the spec from couch again, it was just loaded above
+            for element in inbound:
+                element['WMSpec'] = wmspec
             self.logger.info('Resume splitting of "%s"' % wmspec.name())
         except CouchNotFoundError:
             inbound = [self.backend.createWork(wmspec, Status='Negotiating',
@@ -671,25 +760,33 @@ class WorkQueue(WorkQueueBase):
                                          **filters)
 
         if syncWithWMBS:
-            from WMCore.WorkQueue.WMBSHelper import wmbsSubscriptionStatus
-            wmbs_status = wmbsSubscriptionStatus(logger=self.logger,
-                                                 dbi=self.conn.dbi,
-                                                 conn=self.conn.getDBConn(),
-                                                 transaction=self.conn.existingTransaction())
-            for item in items:
-                for wmbs in wmbs_status:
-                    if item['SubscriptionId'] == wmbs['subscription_id']:
-                        item.updateFromSubscription(wmbs)
-                        break
+            self._syncWithWMBS(items, self._getWMBSSubscriptionStatus())
 
         # if dictKey, format as a dict with the appropriate key
         if dictKey:
-            tmp = defaultdict(list)
-            for item in items:
-                tmp[item[dictKey]].append(item)
-            items = dict(tmp)
+            items = _groupBy(items, dictKey)
         return items
 
+    def _getWMBSSubscriptionStatus(self):
+        """Get the status of all the wmbs subscriptions, indexed by subscription id"""
+        from WMCore.WorkQueue.WMBSHelper import wmbsSubscriptionStatus
+        wmbs_status = wmbsSubscriptionStatus(logger=self.logger,
+                                             dbi=self.conn.dbi,
+                                             conn=self.conn.getDBConn(),
+                                             transaction=self.conn.existingTransaction())
+        wmbsBySubscription = {}
+        for wmbs in wmbs_status:
+            wmbsBySubscription.setdefault(wmbs['subscription_id'], wmbs)
+        return wmbsBySubscription
+
+    @staticmethod
+    def _syncWithWMBS(items, wmbsBySubscription):
+        """Update the elements progress from their wmbs subscription status"""
+        for item in items:
+            wmbs = wmbsBySubscription.get(item['SubscriptionId'])
+            if wmbs:
+                item.updateFromSubscription(wmbs)
+
     def statusInbox(self, status=None, elementIDs=None, dictKey=None, **filters):
         """
         Return elements in the inbox.
@@ -701,10 +798,7 @@ class WorkQueue(WorkQueueBase):
 
         # if dictKey, given format as a dict with the appropriate key
         if dictKey:
-            tmp = defaultdict(list)
-            for item in items:
-                tmp[item[dictKey]].append(item)
-            items = dict(tmp)
+            items = _groupBy(items, dictKey)
 
         return items
 
@@ -731,7 +825,19 @@ class WorkQueue(WorkQueueBase):
             msg = 'Unable to pull work from parent, ParentQueueCouchUrl not provided'
             self._printLog(msg, printFlag, "warning")
             return False
-        if not self.backend.isAvailable() or not self.parent_queue.isAvailable():
+        if not self.backend.isAvailable():
+            msg = 'Backend busy or down: skipping work pull'
+            self._printLog(msg, printFlag, "warning")
+            return False
+
+        # check the local inbox first, the parent queue is only asked when needed
+        still_processing = self.backend.getInboxElements('Negotiating', returnIdOnly=True)
+        if still_processing:
+            msg = 'Not pulling more work. Still processing %d previous units' % len(still_processing)
+            self._printLog(msg, printFlag, "warning")
+            return False
+
+        if not self.parent_queue.isAvailable():
             msg = 'Backend busy or down: skipping work pull'
             self._printLog(msg, printFlag, "warning")
             return False
@@ -743,12 +849,6 @@ class WorkQueue(WorkQueueBase):
             self._printLog(msg, printFlag, "warning")
             return False
 
-        still_processing = self.backend.getInboxElements('Negotiating', returnIdOnly=True)
-        if still_processing:
-            msg = 'Not pulling more work. Still processing %d previous units' % len(still_processing)
-            self._printLog(msg, printFlag, "warning")
-            return False
-
         return True
 
     def freeResouceCheck(self, resources=None, printFlag=False):
@@ -822,52 +922,68 @@ class WorkQueue(WorkQueueBase):
         if workflows:
             workflowsToClose = workflows
         else:
-            workflowsToCheck = self.backend.getInboxElements(OpenForNewData=True)
             workflowsToClose = []
+            newDataFound = []
             currentTime = time.time()
-            for element in workflowsToCheck:
-                # Easy check, close elements with no defined OpenRunningTimeout
-                policy = element.get('StartPolicy', {})
-                openRunningTimeout = policy.get('OpenRunningTimeout', 0)
-                if not openRunningTimeout:
-                    # Closing, no valid OpenRunningTimeout available
-                    workflowsToClose.append(element.id)
-                    continue
-
-                # Check if new data is currently available
-                skipElement = False
-                spec = self.backend.getWMSpec(element.id)
-                for topLevelTask in spec.taskIterator():
-                    policyName = spec.startPolicy()
-                    if not policyName:
-                        raise RuntimeError("WMSpec doesn't define policyName, current value: '%s'" % policyName)
-
-                    policyInstance = startPolicy(policyName, self.params['SplittingMapping'])
-                    if not policyInstance.supportsWorkAddition():
-                        continue
-                    if policyInstance.newDataAvailable(topLevelTask, element):
-                        skipElement = True
-                        self.backend.updateInboxElements(element.id, TimestampFoundNewData=currentTime)
-                        msg = "There are blocks still open for writing in DBS."
-                        self.logdb.post(element['RequestName'], msg, "warning")
-                        break
-                if skipElement:
-                    continue
-
-                # Check if the delay has passed
-                newDataFoundTime = element.get('TimestampFoundNewData', 0)
-                childrenElements = self.backend.getElementsForParent(element)
-                if len(childrenElements) > 0:
-                    lastUpdate = float(max(childrenElements, key=lambda x: x.timestamp).timestamp)
-                    if (currentTime - max(newDataFoundTime, lastUpdate)) > openRunningTimeout:
+            # the open inbox elements are processed in batches to bound the memory used
+            batchSize = self.params['CloseWorkBatchSize']
+            openElements = self.backend.iterInboxElements(batchSize=batchSize, OpenForNewData=True)
+            for workflowsToCheck in grouper(openElements, batchSize):
+                elementsToCheck = []
+                elementsWithTimeout = []
+                for element in workflowsToCheck:
+                    # Easy check, close elements with no defined OpenRunningTimeout
+                    if not element.get('StartPolicy', {}).get('OpenRunningTimeout', 0):
+                        # Closing, no valid OpenRunningTimeout available
                         workflowsToClose.append(element.id)
-                    # if it is successful remove previous error
-                    self.logdb.delete(element.id, "error", this_thread=True)
-                else:
-                    msg = "ChildElement is empty for element id %s: investigate" % element.id
-                    self.logdb.post(element.id, msg, "error")
-                    # self.logdb.upload2central(element.id)
-                    self.logger.error(msg)
+                    else:
+                        elementsWithTimeout.append(element)
+
+                # Check if new data is currently available. The specs are loaded a few at
+                # a time, since they come inline in the reply and can be big
+                for elements in grouper(elementsWithTimeout, self.params['CloseWorkSpecChunkSize']):
+                    specs = self.backend.getWMSpecs([x.id for x in elements])
+                    for element in elements:
+                        skipElement = False
+                        spec = specs.get(element.id) or self.backend.getWMSpec(element.id)
+                        policyName = spec.startPolicy()
+                        if not policyName:
+                            raise RuntimeError("WMSpec doesn't define policyName, current value: '%s'" % policyName)
+
+                        # the policy is the same for all the top level tasks of the spec
+                        policyInstance = startPolicy(policyName, self.params['SplittingMapping'])
+                        if policyInstance.supportsWorkAddition():
+                            for topLevelTask in spec.taskIterator():
+                                if policyInstance.newDataAvailable(topLevelTask, element):
+                                    skipElement = True
+                                    newDataFound.append(element.id)
+                                    msg = "There are blocks still open for writing in DBS."
+                                    self.logdb.post(element['RequestName'], msg, "warning")
+                                    break
+                        if skipElement:
+                            continue
+                        elementsToCheck.append(element)
+
+                # Check if the delay has passed, children of all the elements are fetched at once
+                childrenByParent = self.backend.getElementsForParents(*elementsToCheck)
+                for element in elementsToCheck:
+                    openRunningTimeout = element['StartPolicy']['OpenRunningTimeout']
+                    newDataFoundTime = element.get('TimestampFoundNewData', 0)
+                    childrenElements = childrenByParent[element.id]
+                    if len(childrenElements) > 0:
+                        lastUpdate = max(float(x.timestamp) for x in childrenElements)
+                        if (currentTime - max(newDataFoundTime, lastUpdate)) > openRunningTimeout:
+                            workflowsToClose.append(element.id)
+                        # if it is successful remove previous error
+                        self.logdb.delete(element.id, "error", this_thread=True)
+                    else:
+                        msg = "ChildElement is empty for element id %s: investigate" % element.id
+                        self.logdb.post(element.id, msg, "error")
+                        # self.logdb.upload2central(element.id)
+                        self.logger.error(msg)
+
+            # flag all the elements with new data at once
+            self.backend.updateInboxElements(*newDataFound, TimestampFoundNewData=currentTime)
 
         msg = 'No workflows to close.\n'
         if workflowsToClose:
@@ -892,16 +1008,14 @@ class WorkQueue(WorkQueueBase):
         """
         deletes Workflow when workflow is in finished status
         """
-        deletableStates = ["completed", "closed-out", "failed",
-                           "announced", "aborted-completed", "rejected",
-                           "normal-archived", "aborted-archived", "rejected-archived"]
-
         reqNames = self.backend.getWorkflows(includeInbox=True, includeSpecs=True)
+        if not reqNames:
+            return 0
         requestsInfo = self.requestDB.getRequestByNames(reqNames)
-        deleteRequests = []
-        for key, value in requestsInfo.items():
-            if (value["RequestStatus"] == None) or (value["RequestStatus"] in deletableStates):
-                deleteRequests.append(key)
+        deleteRequests = [key for key, value in requestsInfo.items()
+                          if value["RequestStatus"] is None or value["RequestStatus"] in _DELETABLE_STATES]
+        if not deleteRequests:
+            return 0
 
         return self.backend.deleteWQElementsByWorkflow(deleteRequests)
 
@@ -920,12 +1034,23 @@ class WorkQueue(WorkQueueBase):
         finished_elements = []
 
         useWMBS = not skipWMBS and self.params['LocalQueueFlag']
+        # the wmbs query returns the status of all subscriptions, so run it only once
+        wmbsStatus = None
+        if useWMBS:
+            try:
+                wmbsStatus = self._getWMBSSubscriptionStatus()
+            except Exception as ex:
+                msg = traceback.format_exc()
+                self.logger.error('Failed to get the wmbs subscription status, not syncing with wmbs "%s": %s' %
+                                  (str(ex), msg))
+                useWMBS = False
         # Get queue elements grouped by their workflow with updated wmbs progress
         # Cancel if requested, update locally and remove obsolete elements
-        for wf in self.backend.getWorkflows(includeInbox=True, includeSpecs=True):
+        workflows = self.backend.getWorkflows(includeInbox=True, includeSpecs=True)
+        for wf, elements, parents in self._getElementsByWorkflow(workflows):
             try:
-                elements = self.status(RequestName=wf, syncWithWMBS=useWMBS)
-                parents = self.backend.getInboxElements(RequestName=wf)
+                if useWMBS:
+                    self._syncWithWMBS(elements, wmbsStatus)
 
                 self.logger.debug("Queue status follows:")
                 results = endPolicy(elements, parents, self.params['EndPolicySettings'])
@@ -974,6 +1099,26 @@ class WorkQueue(WorkQueueBase):
                                                                  ', '.join(wf_to_cancel))
         self.backend.recordTaskActivity('housekeeping', msg)
 
+    def _getElementsByWorkflow(self, workflows, batchSize=100):
+        """
+        Yield (workflow, elements, inbox elements) for each workflow, the elements
+        are queried for batchSize workflows at a time. The workflows of a batch
+        that can't be queried are skipped until the next cycle.
+        """
+        for batch in grouper(workflows, batchSize):
+            elements, parents = defaultdict(list), defaultdict(list)
+            try:
+                for element in self.backend.getElements(WorkflowName=batch):
+                    elements[element['RequestName']].append(element)
+                for element in self.backend.getInboxElements(WorkflowName=batch):
+                    parents[element['RequestName']].append(element)
+            except Exception as ex:
+                msg = traceback.format_exc()
+                self.logger.error('Failed to get the elements of workflows %s "%s": %s' % (batch, str(ex), msg))
+                continue
+            for wf in batch:
+                yield wf, elements[wf], parents[wf]
+
     def performQueueCleanupActions(self, skipWMBS=False):
 
         try:
@@ -1016,33 +1161,29 @@ class WorkQueue(WorkQueueBase):
                 continue
             if continuous:
                 policy.modifyPolicyForWorkAddition(inbound)
-            self.logger.info('Splitting %s with policy %s params = %s' % (topLevelTask.getPathName(),
+            # all the units created by the policy belong to this task
+            taskPath = topLevelTask.getPathName()
+            self.logger.info('Splitting %s with policy %s params = %s' % (taskPath,
                                                                           policyName, self.params['SplittingMapping']))
             units, rejectedWork = policy(spec, topLevelTask, data, mask, continuous=continuous)
-            for unit in units:
-                msg = 'Queuing element %s for %s with %d job(s) split with %s' % (unit.id,
-                                                                                  unit['Task'].getPathName(),
-                                                                                  unit['Jobs'], policyName)
-                if unit['Inputs']:
-                    msg += ' on %s' % unit['Inputs'].keys()[0]
-                if unit['Mask']:
-                    msg += ' on events %d-%d' % (unit['Mask']['FirstEvent'], unit['Mask']['LastEvent'])
-                self.logger.info(msg)
+            # don't build the per unit messages if they are not going to be logged
+            if self.logger.isEnabledFor(logging.INFO):
+                for unit in units:
+                    msg = 'Queuing element %s for %s with %d job(s) split with %s' % (unit.id, taskPath,
+                                                                                      unit['Jobs'], policyName)
+                    if unit['Inputs']:
+                        msg += ' on %s' % next(iter(unit['Inputs']))
+                    if unit['Mask']:
+                        msg += ' on events %d-%d' % (unit['Mask']['FirstEvent'], unit['Mask']['LastEvent'])
+                    self.logger.info(msg)
             totalUnits.extend(units)
 
         return (totalUnits, rejectedWork)
 
     def _getTotalStats(self, units):
-        totalToplevelJobs = 0
-        totalEvents = 0
-        totalLumis = 0
-        totalFiles = 0
-
-        for unit in units:
-            totalToplevelJobs += unit['Jobs']
-            totalEvents += unit['NumberOfEvents']
-            totalLumis += unit['NumberOfLumis']
-            totalFiles += unit['NumberOfFiles']
+        getStats = itemgetter('Jobs', 'NumberOfEvents', 'NumberOfLumis', 'NumberOfFiles')
+        totals = [sum(stat) for stat in zip(*[getStats(unit) for unit in units])] or [0, 0, 0, 0]
+        totalToplevelJobs, totalEvents, totalLumis, totalFiles = totals
 
         return {'total_jobs': totalToplevelJobs,
                 'input_events': totalEvents,
@@ -1080,17 +1221,24 @@ class WorkQueue(WorkQueueBase):
                     # get statistics for the new work
                     totalStats = self._getTotalStats(newWork)
 
+                    # inbox element changes, sent to couch with a single update
+                    inboxUpdate = {}
                     if not continuous:
                         # Update to Acquired when it's the first processing of inbound work
-                        self.backend.updateInboxElements(inbound.id, Status='Acquired')
+                        inboxUpdate['Status'] = 'Acquired'
 
                     # store the inputs in the global queue inbox workflow element
                     if not self.params.get('LocalQueueFlag'):
                         processedInputs = []
                         for unit in work:
                             processedInputs.extend(unit['Inputs'].keys())
-                        self.backend.updateInboxElements(inbound.id, ProcessedInputs=processedInputs,
-                                                                 RejectedInputs=rejectedWork)
+                        inboxUpdate['ProcessedInputs'] = processedInputs
+                        inboxUpdate['RejectedInputs'] = rejectedWork
+
+                    if inboxUpdate:
+                        self.backend.updateInboxElements(inbound.id, **inboxUpdate)
+
+                    if not self.params.get('LocalQueueFlag'):
                         # if global queue, then update workflow stats to request mgr couch doc
                         # remove the "UnittestFlag" - need to create the reqmgrSvc emulator
                         if not self.params.get("UnittestFlag", False):
@@ -1119,7 +1267,7 @@ class WorkQueue(WorkQueueBase):
             else:
                 result.extend(work)
 
-        requests = ', '.join(list(set(['"%s"' % x['RequestName'] for x in result])))
+        requests = ', '.join('"%s"' % name for name in {x['RequestName'] for x in result})
         if requests:
             self.logger.info('Split work for request(s): %s' % requests)
 
@@ -1154,12 +1302,16 @@ class WorkQueue(WorkQueueBase):
 
         # now the heavy procesing for the site information
         elements = self.workqueueDS.getElementsByStatus(status)
-        uniSites, posSites = getGlobalSiteStatusSummary(elements)
-        results['uniqueJobsPerSiteAAA'] = uniSites
-        results['possibleJobsPerSiteAAA'] = posSites
-        uniSites, posSites = getGlobalSiteStatusSummary(elements, dataLocality=True)
-        results['uniqueJobsPerSite'] = uniSites
-        results['possibleJobsPerSite'] = posSites
+        if elements:
+            uniSites, posSites = getGlobalSiteStatusSummary(elements)
+            results['uniqueJobsPerSiteAAA'] = uniSites
+            results['possibleJobsPerSiteAAA'] = posSites
+            uniSites, posSites = getGlobalSiteStatusSummary(elements, dataLocality=True)
+            results['uniqueJobsPerSite'] = uniSites
+            results['possibleJobsPerSite'] = posSites
+        else:
+            for key in ('uniqueJobsPerSiteAAA', 'possibleJobsPerSiteAAA', 'uniqueJobsPerSite', 'possibleJobsPerSite'):
+                results[key] = {}
 
         end = int(time.time())
         results["total_query_time"] = end - start
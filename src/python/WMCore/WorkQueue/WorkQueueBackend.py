@@ -5,11 +5,18 @@ WorkQueueBackend
 Interface to WorkQueue persistent storage
 """
 
+import base64
 import json
 import random
 import time
 import urllib
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from Utils.IteratorTools import grouper
 from WMCore.Database.CMSCouch import CouchServer, CouchNotFoundError, Document
 from WMCore.Lexicon import sanitizeURL
 from WMCore.WMSpec.WMWorkload import WMWorkloadHelper
@@ -62,6 +69,9 @@ class WorkQueueBackend(object):
         self.inbox = self.server.connectDatabase(inbox_name, create=False, size=10000)
         self.queueUrl = sanitizeURL(queueUrl or (db_url + '/' + db_name))['url']
         self.eleKey = 'WMCore.WorkQueue.DataStructs.WorkQueueElement.WorkQueueElement'
+        # isAvailable() positive answers are cached for this many seconds
+        self.availableCacheTime = 5
+        self.availableUntil = 0
 
     def forceQueueSync(self):
         """Force a blocking replication - used only in tests"""
@@ -125,6 +135,25 @@ class WorkQueueBackend(object):
         wmspec.load(self.db['host'] + "/%s/%s/spec" % (self.db.name, name))
         return wmspec
 
+    def getWMSpecs(self, names):
+        """Get the specs of several workflows with a single request
+
+        Returns a dict of {name: spec}, workflows without a spec are left out.
+        The specs come base64 encoded in a single reply, so only ask for a few at a time
+        """
+        specs = {}
+        if not names:
+            return specs
+        rows = self.db.allDocs({'include_docs': True, 'attachments': True}, list(names))['rows']
+        for row in rows:
+            attachment = (row.get('doc') or {}).get('_attachments', {}).get('spec', {})
+            if 'data' not in attachment:
+                continue
+            wmspec = WMWorkloadHelper()
+            wmspec.data = pickle.loads(base64.b64decode(attachment['data']))
+            specs[row['id']] = wmspec
+        return specs
+
     def insertElements(self, units, parent=None):
         """
         Insert element to database
@@ -181,7 +210,8 @@ class WorkQueueBackend(object):
         returnIdOnly causes the element not to be loaded and only the id returned
         db is used to specify which database to return from
         loadSpec causes the workflow for each spec to be loaded.
-        WorkflowName may be used in the place of RequestName
+        WorkflowName may be used in the place of RequestName, it can also be
+        a list of workflow names to get the elements of all of them at once
         """
         key = []
         if not db:
@@ -193,13 +223,17 @@ class WorkQueueBackend(object):
             if elementFilters or status or returnIdOnly:
                 raise ValueError(
                     "Can't specify extra filters (or return id's) when using element id's with getElements()")
-            elements = [CouchWorkQueueElement(db, i).load() for i in elementIDs]
+            elements = self.loadElements(*[CouchWorkQueueElement(db, i) for i in elementIDs])
         else:
             options = {'include_docs': True, 'filter': elementFilters, 'idOnly': returnIdOnly, 'reduce': False}
             # filter on workflow or status if possible
             filterName = 'elementsByWorkflow'
             if WorkflowName:
-                key.append(WorkflowName)
+                if isinstance(WorkflowName, basestring):
+                    key.append(WorkflowName)
+                else:
+                    WorkflowName = list(WorkflowName)
+                    key.extend(WorkflowName)
             elif status:
                 filterName = 'elementsByStatus'
                 key.append(status)
@@ -209,7 +243,9 @@ class WorkQueueBackend(object):
             # add given params to filters
             if status:
                 options['filter']['Status'] = status
-            if WorkflowName:
+            if WorkflowName and isinstance(WorkflowName, basestring):
+                # several workflows are already selected by the view keys, and listing them
+                # in the filter would put every name in the query string of the request
                 options['filter']['RequestName'] = WorkflowName
 
             view = db.loadList('WorkQueue', 'filter', filterName, options, key)
@@ -234,6 +270,29 @@ class WorkQueueBackend(object):
         """
         return self.getElements(*args, db=self.inbox, **kwargs)
 
+    def iterInboxElements(self, batchSize=200, **elementFilters):
+        """
+        Generator over the Inbox elements matching the given filters
+
+        Only the matching ids are fetched up front, the documents are then
+        loaded batchSize at a time, so the whole inbox is never held in memory.
+        Elements deleted in the meantime are skipped.
+        """
+        elementIDs = self.getInboxElements(returnIdOnly=True, **elementFilters)
+        return self.iterInboxElementsById(elementIDs, batchSize)
+
+    def iterInboxElementsById(self, elementIDs, batchSize=200):
+        """
+        Generator over the Inbox elements with the given ids, loaded batchSize at a time
+
+        Unlike getInboxElements(elementIDs=...) ids without a document are skipped
+        """
+        for ids in grouper(elementIDs, batchSize):
+            rows = self.inbox.allDocs({'include_docs': True}, ids)['rows']
+            for row in rows:
+                if row.get('doc'):
+                    yield CouchWorkQueueElement.fromDocument(self.inbox, row['doc'])
+
     def getElementsForWorkflow(self, workflow):
         """Get elements for a workflow"""
         elements = self.db.loadView('WorkQueue', 'elementsByWorkflow',
@@ -249,6 +308,32 @@ class WorkQueueBackend(object):
                                                    x['doc'])
                 for x in elements.get('rows', [])]
 
+    def getElementsForParents(self, *parents):
+        """Get the elements of several parents with a single query, as {parent id: [elements]}"""
+        result = dict((x.id, []) for x in parents)
+        if not parents:
+            return result
+        elements = self.db.loadView('WorkQueue', 'elementsByParent', {'include_docs': True}, list(result))
+        for row in elements.get('rows', []):
+            result[row['key']].append(CouchWorkQueueElement.fromDocument(self.db, row['doc']))
+        return result
+
+    def loadElements(self, *elements):
+        """Reload elements from couch, like element.load() does, with a single request
+
+        Elements are expected to belong to the same database
+        """
+        if not elements:
+            return []
+        couch = elements[0]._couch
+        rows = couch.allDocs({'include_docs': True}, [x.id for x in elements])['rows']
+        docs = dict((row['id'], row['doc']) for row in rows if row.get('doc'))
+        for element in elements:
+            if element.id not in docs:
+                raise CouchNotFoundError('Element document not found', element.id, None)
+            element.loadDocument(docs[element.id])
+        return list(elements)
+
     def saveElements(self, *elements):
         """Persist elements
 
@@ -266,6 +351,35 @@ class WorkQueueBackend(object):
             self.logger.error(msg % (failed['id'], failed['error'], failed['reason']))
         return result
 
+    def updateAndSaveElements(self, *elements, **updatedParams):
+        """Set the given parameters on the elements and persist them
+
+        Elements are saved against the revision they were read with, so no
+        concurrent change is overwritten. Only the ones that hit a conflict
+        are reloaded and saved again (up to 3 times).
+        Returns elements successfully saved.
+        """
+        result = []
+        conflictRetries = 3
+        for attempt in range(conflictRetries + 1):
+            if not elements:
+                break
+            for element in elements:
+                element.update(updatedParams)
+                element.save()
+            answer = elements[0]._couch.commit()
+            saved, failures = formatReply(answer, *elements)
+            result.extend(saved)
+            conflicts = set()
+            msg = 'Couch error saving element: "%s", error "%s", reason "%s"'
+            for failed in failures:
+                if failed['error'] == 'conflict' and attempt < conflictRetries:
+                    conflicts.add(failed['id'])
+                else:
+                    self.logger.error(msg % (failed['id'], failed['error'], failed['reason']))
+            elements = self.loadElements(*[x for x in elements if x.id in conflicts])
+        return result
+
     def _raiseConflictErrorAndLog(self, conflictIDs, updatedParams, dbName="workqueue"):
         errorMsg = "Need to update this element manually from %s\n ids:%s\n, parameters:%s\n" % (
                                             dbName, conflictIDs, updatedParams)
@@ -460,7 +574,13 @@ class WorkQueueBackend(object):
                 for x in elements.get('rows', [])]
 
     def isAvailable(self):
-        """Is the server available, i.e. up and not compacting"""
+        """Is the server available, i.e. up and not compacting
+
+        A positive answer is reused for availableCacheTime seconds,
+        so the checks made by the queue within one cycle query couch once
+        """
+        if time.time() < self.availableUntil:
+            return True
         try:
             compacting = self.db.info()['compact_running']
             if compacting:
@@ -469,6 +589,7 @@ class WorkQueueBackend(object):
         except Exception as ex:
             self.logger.error("CouchDB unavailable: %s" % str(ex))
             return False
+        self.availableUntil = time.time() + self.availableCacheTime
         return True
 
     def getWorkflows(self, includeInbox=False, includeSpecs=False):
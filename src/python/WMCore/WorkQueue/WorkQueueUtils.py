@@ -6,6 +6,7 @@ __all__ = ['get_remote_queue', 'get_dbs',
 
 import logging
 import os
+import time
 
 __queues = {}
 
@@ -41,12 +42,16 @@ def get_dbs(url):
 
 __sitedb = None
 __cmsSiteNames = []
+__cmsSiteNamesTime = 0
+# how long (in seconds) the cms site names are cached for
+CMS_SITE_NAMES_CACHE_TIME = 3600
 
 
 def cmsSiteNames():
-    """Get all cms sites"""
+    """Get all cms sites, cached for CMS_SITE_NAMES_CACHE_TIME"""
     global __cmsSiteNames
-    if __cmsSiteNames:
+    global __cmsSiteNamesTime
+    if __cmsSiteNames and time.time() - __cmsSiteNamesTime < CMS_SITE_NAMES_CACHE_TIME:
         return __cmsSiteNames
     global __sitedb
     if not __sitedb:
@@ -54,7 +59,9 @@ def cmsSiteNames():
         __sitedb = SiteDB()
     try:
         __cmsSiteNames = __sitedb.getAllCMSNames()
+        __cmsSiteNamesTime = time.time()
     except Exception:
+        # keep the previous site names, if any
         pass
     return __cmsSiteNames
 
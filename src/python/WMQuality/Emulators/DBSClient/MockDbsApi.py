@@ -6,39 +6,128 @@ Version of dbsClient.dbsApi intended to be used with mock or unittest.mock
 
 from __future__ import (division, print_function)
 
-import copy
-import json
+import marshal
 import os
+import sys
+import tempfile
+from functools import partial
+from hashlib import md5
+
+try:
+    # much faster on the large mock data files, when available
+    from orjson import loads as jsonLoads
+except ImportError:
+    from json import loads as jsonLoads
 
 from RestClient.ErrorHandling.RestClientExceptions import HTTPError
 from WMCore.Services.DBS.DBSErrors import DBSReaderError
 from WMCore.WMBase import getTestBase
 
 
-# Read in the data just once so that we don't have to do it for every test (in __init__)
+def _cacheName(fileName):
+    """
+    Name of the cache of a mock data file, in the temporary directory so that the
+    source tree is left alone. The name depends on the path, size and modification
+    time of the file, so that a changed file never maps to an old cache, and on the
+    python version, since the marshal format depends on it.
+    """
+    fileName = os.path.abspath(fileName)
+    fileStat = os.stat(fileName)
+    fileKey = '%s:%d:%r' % (fileName, fileStat.st_size, fileStat.st_mtime)
+    return os.path.join(tempfile.gettempdir(), 'WMCoreMock_%s_%s.py%d%d.marshal' %
+                        ((os.path.basename(fileName), md5(fileKey).hexdigest()[:12]) + tuple(sys.version_info[:2])))
+
+
+def _loadMockFile(fileName):
+    """
+    Parse one of the mock data files, an empty dict is returned if it can't be read
+
+    The parsed data is also marshalled to a cache file, and that copy is used
+    instead as long as the json file is left unchanged.
+    """
+    try:
+        cacheName = _cacheName(fileName)
+    except OSError:
+        return {}
+    try:
+        # only trust our own cache files, the temporary directory may be shared
+        if os.stat(cacheName).st_uid == os.getuid():
+            with open(cacheName, 'rb') as cacheFile:
+                return marshal.load(cacheFile)
+    except Exception:
+        # no cache, or an unreadable one
+        pass
+
+    try:
+        with open(fileName, 'rb') as mockFile:
+            data = jsonLoads(mockFile.read())
+    except IOError:
+        return {}
+
+    tmpName = None
+    try:
+        # write and rename, so that concurrent test processes never read a partial file
+        fd, tmpName = tempfile.mkstemp(dir=os.path.dirname(cacheName))
+        with os.fdopen(fd, 'wb') as cacheFile:
+            marshal.dump(data, cacheFile)
+        os.rename(tmpName, cacheName)
+    except Exception:
+        # just don't cache, without leaving the partial file behind
+        if tmpName and os.path.exists(tmpName):
+            os.unlink(tmpName)
+    return data
+
+
+def _lookupMethod(item):
+    """
+    Return a MockDbsApi method serving the DBS method item from the lookup table
+    """
+    def lookup(self, *args, **kwargs):
+        return self._genericLookup(item, *args, **kwargs)
+    lookup.__name__ = str(item)
+    lookup.__doc__ = "Mocked DBS %s call" % item
+    return lookup
+
+
+def _loadUrl(url):
+    """
+    Return the mock data of a DBS instance, None if there is no mock data for it.
+    The file is only read the first time the instance is used.
+    """
+    if url not in mockData and url in mockFiles:
+        mockData[url] = _loadMockFile(mockFiles[url])
+    return mockData.get(url)
+
+
+# Read in the data just once so that we don't have to do it for every test (in __init__),
+# and only for the instances actually used, since many tests import this module without needing DBS
 
 mockData = {}
 globalFile = os.path.join(getTestBase(), '..', 'data', 'Mock', 'DBSMockData.json')
 phys03File = os.path.join(getTestBase(), '..', 'data', 'Mock', 'DBSMockData03.json')
 
-try:
-    with open(globalFile, 'r') as mockFile:
-        mockDataGlobal = json.load(mockFile)
-except IOError:
-    mockDataGlobal = {}
-try:
-    with open(phys03File, 'r') as mockFile:
-        mockData03 = json.load(mockFile)
-except IOError:
-    mockData03 = {}
+# stands for the file name while formatting the signatures of the per file lookups
+LFN_PLACEHOLDER = u'\x00lfn\x00'
 
-mockData['https://cmsweb.cern.ch/dbs/prod/global/DBSReader'] = mockDataGlobal
-mockData['https://cmsweb.cern.ch/dbs/prod/phys03/DBSReader'] = mockData03
+# DBS client methods answered from the lookup table, defined on MockDbsApi below.
+# Any other method is still served through MockDbsApi.__getattr__
+DBS_LOOKUP_METHODS = ['listBlockOrigin', 'listBlockParents', 'listBlocks', 'listDataTiers', 'listDatasetParents',
+                      'listDatasets', 'listFileLumis', 'listFileParents', 'listFileSummaries',
+                      'listPrimaryDatasets', 'listRuns']
+
+mockFiles = {'https://cmsweb.cern.ch/dbs/prod/global/DBSReader': globalFile,
+             'https://cmsweb.cern.ch/dbs/prod/phys03/DBSReader': phys03File}
 
 
 class MockDbsApi(object):
+    __slots__ = ('url', '_urlData', '_lookups')
+
     def __init__(self, url):
         self.url = url.strip('/')
+        # lookup table of this instance, None if the mock knows nothing about it
+        self._urlData = _loadUrl(self.url)
+        # lookup functions handed out by __getattr__, one per method name
+        self._lookups = {}
 
         # print("Initializing MockDBSApi")
 
@@ -56,17 +145,10 @@ class MockDbsApi(object):
         Returns:
 
         """
-        self.item = 'listFileArray'
-
         if 'logical_file_name' in kwargs and len(kwargs['logical_file_name']) > 1:
-            origArgs = copy.deepcopy(kwargs)
-            returnDicts = []
-            for lfn in kwargs['logical_file_name']:
-                origArgs.update({'logical_file_name': [unicode(lfn)]})
-                returnDicts.extend(self.genericLookup(**origArgs))
-            return returnDicts
+            return self._lookupPerFile('listFileArray', **kwargs)
         else:
-            return self.genericLookup(**kwargs)
+            return self._lookupSignature('listFileArray', self._signature('listFileArray', kwargs), **kwargs)
 
     def listFileLumiArray(self, **kwargs):
         """
@@ -79,51 +161,100 @@ class MockDbsApi(object):
         Returns:
 
         """
-        self.item = 'listFileLumiArray'
-
         if 'logical_file_name' in kwargs and len(kwargs['logical_file_name']) > 1:
-            origArgs = copy.deepcopy(kwargs)
-            returnDicts = []
-            for lfn in kwargs['logical_file_name']:
-                origArgs.update({'logical_file_name': [unicode(lfn)]})
-                returnDicts.extend(self.genericLookup(**origArgs))
-            return returnDicts
+            return self._lookupPerFile('listFileLumiArray', **kwargs)
         else:
-            return self.genericLookup(**kwargs)
+            return self._lookupSignature('listFileLumiArray', self._signature('listFileLumiArray', kwargs), **kwargs)
+
+    def _lookupPerFile(self, item, **kwargs):
+        """
+        Look up each of the logical_file_name separately and concatenate the results.
+        The sorted arguments are computed once, only the file name changes between lookups.
+        """
+        # format the signature once around a placeholder file name, each file
+        # then only joins the repr of its name between the two halves
+        lfnList = [LFN_PLACEHOLDER]
+        origArgs = dict(kwargs, logical_file_name=lfnList)
+        prefix, suffix = ('%s:%s' % (item, sorted(origArgs.items()))).split(repr(LFN_PLACEHOLDER))
+        signatures = [''.join((prefix, repr(unicode(lfn)), suffix)) for lfn in kwargs['logical_file_name']]
+
+        # all the files are normally known, resolve them in one go
+        if self._urlData is not None:
+            try:
+                results = [self._urlData[signature] for signature in signatures]
+            except KeyError:
+                pass
+            else:
+                if 'Raises HTTPError' not in results:
+                    return [row for result in results for row in result]
+
+        # otherwise go one by one, to raise the same error as a single file lookup would
+        returnDicts = []
+        for lfn, signature in zip(kwargs['logical_file_name'], signatures):
+            lfnList[0] = unicode(lfn)
+            returnDicts.extend(self._lookupSignature(item, signature, **origArgs))
+        return returnDicts
 
     def __getattr__(self, item):
         """
         __getattr__ gets called in case lookup of the actual method fails. We use this to return data based on
-        a lookup table
+        a lookup table, for the methods not already listed in DBS_LOOKUP_METHODS
 
         :param item: The method name the user is trying to call
-        :return: The generic lookup function
+        :return: The generic lookup function, bound to that method name
         """
-        self.item = item
-        return self.genericLookup
+        if item.startswith('__') or item in self.__slots__:
+            # special methods are looked up by the python machinery (copy, pickle...), they don't exist.
+            # Neither do the attributes of an instance whose __init__ didn't run, and looking up
+            # _lookups below would otherwise call __getattr__ again for ever
+            raise AttributeError(item)
+        lookup = self._lookups.get(item)
+        if lookup is None:
+            lookup = self._lookups[item] = partial(self._genericLookup, item)
+        return lookup
 
-    def genericLookup(self, *args, **kwargs):
+    def _genericLookup(self, item, *args, **kwargs):
         """
         This function returns the mocked DBS data
 
+        :param item: the DBS method called
         :param args: positional arguments it was called with
         :param kwargs: named arguments it was called with
         :return: the dictionary that DBS would have returned
         """
+        return self._lookupSignature(item, self._signature(item, kwargs), *args, **kwargs)
 
-        if self.url not in mockData.keys():
-            raise DBSReaderError("Mock DBS emulator knows nothing about instance %s" % self.url)
+    @staticmethod
+    def _signature(item, kwargs):
+        """
+        Return the lookup table key of a call
+        """
+        return '%s:%s' % (item, sorted(kwargs.iteritems())) if kwargs else item
 
-        if kwargs:
-            signature = '%s:%s' % (self.item, sorted(kwargs.iteritems()))
-        else:
-            signature = self.item
+    def _lookupSignature(self, item, signature, *args, **kwargs):
+        """
+        Return the mocked DBS data stored under an already computed signature
+
+        :param item: the DBS method called
+        :param signature: the lookup table key
+        :param args: positional arguments, only used in the error message
+        :param kwargs: named arguments, only used in the error message
+        :return: the dictionary that DBS would have returned
+        """
+        if self._urlData is None:
+            raise DBSReaderError("Mock DBS emulator knows nothing about instance %s" % self.url)
 
         try:
-            if mockData[self.url][signature] == 'Raises HTTPError':
-                raise HTTPError('http:/dbs.mock.fail', 400, 'MockDBS is raising an exception in place of DBS', 'Dummy header', 'Dummy body')
-            else:
-                return mockData[self.url][signature]
+            result = self._urlData[signature]
         except KeyError:
             raise KeyError("DBS mock API could not return data for method %s, args=%s, and kwargs=%s (URL %s)." %
-                           (self.item, args, kwargs, self.url))
+                           (item, args, kwargs, self.url))
+
+        if result == 'Raises HTTPError':
+            raise HTTPError('http:/dbs.mock.fail', 400, 'MockDBS is raising an exception in place of DBS', 'Dummy header', 'Dummy body')
+        return result
+
+
+for _method in DBS_LOOKUP_METHODS:
+    setattr(MockDbsApi, _method, _lookupMethod(_method))
+del _method
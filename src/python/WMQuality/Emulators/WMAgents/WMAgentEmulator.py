@@ -34,7 +34,4 @@ class WMAgentEmulator(Harness):
         emulating resource db which can represent
         {site: job} format
         """
-        jobSites = {}
-        for site in DUMMY_SITES:
-            jobSites[site] = 100
-        return jobSites
+        return dict.fromkeys(DUMMY_SITES, 100)
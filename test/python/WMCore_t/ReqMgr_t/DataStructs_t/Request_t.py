@@ -5,9 +5,10 @@ Unittests for IteratorTools functions
 
 from __future__ import division, print_function
 from pprint import pprint
+import re
 import unittest
 from copy import deepcopy
-from WMCore.ReqMgr.DataStructs.Request import initialize_clone
+from WMCore.ReqMgr.DataStructs.Request import initialize_clone, protectedLFNs, RequestInfo, _isChainKey
 from WMCore.WMSpec.StdSpecs.MonteCarlo import MonteCarloWorkloadFactory
 from WMCore.WMSpec.StdSpecs.ReReco import ReRecoWorkloadFactory
 from WMCore.WMSpec.StdSpecs.StepChain import StepChainWorkloadFactory
@@ -267,6 +268,54 @@ class RequestTests(unittest.TestCase):
         mcArgs = deepcopy(mcOriginalArgs)
         self.assertDictEqual(cloneArgs, updateDict(mcArgs, requestArgs))
 
+    def testRequestInfo(self):
+        """
+        Test RequestInfo get and andFilterCheck for Task/StepChain requests
+        """
+        reqInfo = RequestInfo(deepcopy(taskChainOriginalArgs))
+        self.assertItemsEqual(reqInfo.get("LumisPerJob"), [10])
+        self.assertItemsEqual(reqInfo.get("ProcessingVersion"), [2])
+        self.assertItemsEqual(reqInfo.get("ScramArch"), ["slc6_amd64_gcc481", "slc7_amd64_gcc630"])
+        self.assertIsNone(reqInfo.get("BadKey"))
+        self.assertTrue(reqInfo.andFilterCheck({"ProcessingVersion": [1, 2]}))
+        self.assertTrue(reqInfo.andFilterCheck({"Campaign": "MainTask"}))
+        self.assertFalse(reqInfo.andFilterCheck({"ProcessingVersion": [1, 3]}))
+        self.assertFalse(reqInfo.andFilterCheck({"BadKey": ["blah"]}))
+
+        reqInfo = RequestInfo(deepcopy(stepChainOriginalArgs))
+        self.assertItemsEqual(reqInfo.get("GlobalTag"), ["PHYS18"])
+        self.assertEqual(reqInfo.get("Memory"), 1234)
+
+        reqInfo = RequestInfo(deepcopy(mcOriginalArgs))
+        self.assertEqual(reqInfo.get("Memory"), 1234)
+        self.assertEqual(reqInfo.get("BadKey", "default"), "default")
+        self.assertTrue(reqInfo.andFilterCheck({"RequestType": ["MonteCarlo", "ReReco"]}))
+        self.assertFalse(reqInfo.andFilterCheck({"RequestType": ["ReReco"]}))
+
+    def testProtectedLFNs(self):
+        """
+        Test protectedLFNs for active and inactive requests
+        """
+        reqArgs = {"RequestStatus": "running-open", "OutputDatasets": ["/Prim/Era-Proc-v1/RECO"]}
+        self.assertEqual(protectedLFNs(reqArgs), ["/store/unmerged/Era/Prim/RECO/Proc-v1"])
+
+        reqArgs["UnmergedLFNBase"] = "/store/backfill/1/unmerged"
+        partsCache = {}
+        self.assertEqual(protectedLFNs(reqArgs, partsCache), ["/store/backfill/1/unmerged/Era/Prim/RECO/Proc-v1"])
+        self.assertEqual(partsCache, {"/Prim/Era-Proc-v1/RECO": ("Era", "Prim", "RECO", "Proc-v1")})
+
+        reqArgs["RequestStatus"] = "announced"
+        self.assertEqual(protectedLFNs(reqArgs), [])
+        self.assertEqual(protectedLFNs({"RequestStatus": "running-open", "OutputDatasets": []}), [])
+
+    def testIsChainKey(self):
+        """
+        Test _isChainKey matches the keys the former chain key regex matched
+        """
+        for key in ["Task1", "Step12", "Task123", "Step1Name", u"Task2", "Task", "Step", "TaskChain",
+                    "StepChain", "task1", "Tasks1", "Task_1", "", "T", "Task\xd9\xa1", u"Task\u0661"]:
+            self.assertEqual(_isChainKey(key), bool(re.match(r'(Task|Step)\d{1,2}', key)), key)
+
 
 if __name__ == '__main__':
     unittest.main()
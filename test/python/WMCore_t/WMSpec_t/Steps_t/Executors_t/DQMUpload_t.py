@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+"""
+_DQMUpload_t_
+
+Unittests for the DQMUpload executor multipart encoding and checksum
+"""
+from __future__ import print_function
+
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+import WMCore.WMSpec.Steps.Executors.DQMUpload as DQMUploadModule
+from WMCore.Configuration import ConfigSection
+from WMCore.WMSpec.Steps.Executors.DQMUpload import DQMUpload
+
+
+def legacyEncode(executor, args, files):
+    """
+    The multipart encoding as it was done before streaming the body,
+    files are given as {name: filename}
+    """
+    boundary = '----------=_DQM_FILE_BOUNDARY_=-----------'
+    (body, crlf) = ('', '\r\n')
+    for (key, value) in args.items():
+        payload = str(value)
+        body += '--' + boundary + crlf
+        body += ('Content-Disposition: form-data; name="%s"' % key) + crlf
+        body += crlf + payload + crlf
+    for (key, filename) in files.items():
+        body += '--' + boundary + crlf
+        body += ('Content-Disposition: form-data; name="%s"; filename="%s"'
+                 % (key, os.path.basename(filename))) + crlf
+        body += ('Content-Type: %s' % executor.filetype(filename)) + crlf
+        body += ('Content-Length: %d' % os.path.getsize(filename)) + crlf
+        with open(filename, 'rb') as fd:
+            body += crlf + fd.read() + crlf
+        body += '--' + boundary + '--' + crlf + crlf
+    return ('multipart/form-data; boundary=' + boundary, body)
+
+
+def readAll(body, blockSize):
+    """
+    Read a body in blocks, the way httplib sends it
+    """
+    chunks = []
+    while True:
+        chunk = body.read(blockSize)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return ''.join(chunks)
+
+
+class FakeResponse(object):
+    """
+    Minimal urllib2 response, returning the given data
+    """
+
+    def __init__(self, headers, data):
+        self.headers = headers
+        self.data = StringIO(data)
+
+    def read(self, size=-1):
+        return self.data.read(size)
+
+
+class FakeOpener(object):
+    """
+    Url opener recording the requests, answering them with a gzip'ed reply
+    """
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+
+    def open(self, request):
+        self.requests.append((request, readAll(request.get_data(), 8192)))
+        buf = StringIO()
+        with gzip.GzipFile(fileobj=buf, mode='wb') as gzipFile:
+            gzipFile.write(self.reply)
+        return FakeResponse({'Content-encoding': 'gzip'}, buf.getvalue())
+
+
+class DQMUploadTest(unittest.TestCase):
+    """
+    Test the DQMUpload executor without any DQM server
+    """
+
+    def setUp(self):
+        self.testDir = tempfile.mkdtemp()
+        self.dqmFile = os.path.join(self.testDir, 'DQM_V0001_R000000001__Test__Run__DQMIO.root')
+        # a few MB of data, bigger than the block sizes used for reading
+        with open(self.dqmFile, 'wb') as fd:
+            fd.write(os.urandom(3 * 1024 * 1024 + 17))
+        self.args = {'size': os.path.getsize(self.dqmFile), 'checksum': 'md5:abc'}
+        self.executor = DQMUpload()
+
+    def tearDown(self):
+        shutil.rmtree(self.testDir)
+
+    def testEncode(self):
+        """
+        Test the streamed multipart body against the former in-memory encoding
+        """
+        (contentType, expected) = legacyEncode(self.executor, self.args, {'file': self.dqmFile})
+        with open(self.dqmFile, 'rb') as fd:
+            (newType, body) = self.executor.encode(self.args, {'file': (self.dqmFile, fd, self.args['size'])})
+            self.assertEqual(newType, contentType)
+            self.assertEqual(len(body), len(expected))
+            data = readAll(body, 8192)
+            self.assertEqual(len(data), len(body))
+            self.assertEqual(data, expected)
+
+            # the file is rewound for the next upload url
+            (_, body) = self.executor.encode(self.args, {'file': (self.dqmFile, fd, self.args['size'])})
+            self.assertEqual(body.read(), data)
+
+        return
+
+    def testMultipartBody(self):
+        """
+        Test reading a body made of strings and files in blocks of any size
+        """
+        with open(self.dqmFile, 'rb') as fd:
+            content = fd.read()
+        for blockSize in (7, 8192, 1024 * 1024, -1):
+            with open(self.dqmFile, 'rb') as fd:
+                body = DQMUploadModule.MultipartBody(['head', (fd, len(content)), '', 'tail'])
+                self.assertEqual(len(body), len(content) + 8)
+                data = body.read() if blockSize < 0 else readAll(body, blockSize)
+                self.assertEqual(data, 'head' + content + 'tail')
+                self.assertEqual(body.read(), '')
+
+        return
+
+    def checksumArgs(self):
+        """
+        Run httpPost, returning the arguments it uploads
+        """
+        uploaded = []
+        self.executor.step = ConfigSection('step')
+        self.executor.step.section_('upload')
+        self.executor.step.upload.URL = 'http://dqm.test'
+        self.executor.upload = lambda url, args, filename, fd: (uploaded.append(dict(args)) or ({}, ''))
+        self.executor.httpPost(self.dqmFile)
+        self.assertEqual(len(uploaded), 1)
+        return uploaded[0]
+
+    def testChecksum(self):
+        """
+        Test the checksum computed from a memory map and from the file blocks
+        """
+        with open(self.dqmFile, 'rb') as fd:
+            expected = 'md5:%s' % hashlib.md5(fd.read()).hexdigest()
+
+        args = self.checksumArgs()
+        self.assertEqual(args['checksum'], expected)
+        self.assertEqual(args['size'], os.path.getsize(self.dqmFile))
+
+        maxMmapSize = DQMUploadModule.MAX_MMAP_CHECKSUM_SIZE
+        DQMUploadModule.MAX_MMAP_CHECKSUM_SIZE = 1024
+        try:
+            self.assertEqual(self.checksumArgs()['checksum'], expected)
+        finally:
+            DQMUploadModule.MAX_MMAP_CHECKSUM_SIZE = maxMmapSize
+
+        return
+
+    def testUpload(self):
+        """
+        Test an upload through a fake opener, with a gzip'ed reply
+        """
+        reply = 'DQM upload reply ' * 10000
+        opener = FakeOpener(reply)
+        self.executor.openers[False] = opener
+        (_, expected) = legacyEncode(self.executor, self.args, {'file': self.dqmFile})
+
+        with open(self.dqmFile, 'rb') as fd:
+            for _ in range(2):
+                (headers, data) = self.executor.upload('http://dqm.test', self.args, self.dqmFile, fd)
+                self.assertEqual(headers, {'Content-encoding': 'gzip'})
+                self.assertEqual(data, reply)
+
+        self.assertEqual(len(opener.requests), 2)
+        for (request, sent) in opener.requests:
+            self.assertEqual(request.get_full_url(), 'http://dqm.test/data/put')
+            self.assertEqual(int(request.get_header('Content-length')), len(expected))
+            self.assertEqual(sent, expected)
+
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,6 @@
 
 
 import unittest
-import math
 from functools import partial
 from WMCore.WorkQueue.Policy.End.SingleShot import SingleShot
 from WMCore.WorkQueue.DataStructs.WorkQueueElement import WorkQueueElement as WQE
@@ -15,17 +14,18 @@ from WMCore.WorkQueue.DataStructs.WorkQueueElement import WorkQueueElement as WQ
 
 class SingleShotTestCase(unittest.TestCase):
 
-    def setUp(self):
-        """Create workflow stuff"""
-        self.policy = partial(SingleShot)
+    @classmethod
+    def setUpClass(cls):
+        """Create workflow stuff, shared by all the tests which must not modify it"""
+        cls.policy = partial(SingleShot)
 
         # ones i made earlier
-        self.parent = WQE(); self.parent.id = 1
-        self.available = WQE(Status = 'Available', ParentQueueId = 1)
-        self.acquired = WQE(Status = 'Acquired', ParentQueueId = 1)
-        self.negotiating = WQE(Status = 'Negotiating', ParentQueueId = 1)
-        self.done = WQE(Status = 'Done', PercentComplete = 100, PercentSuccess = 100, ParentQueueId = 1)
-        self.failed = WQE(Status = 'Failed', PercentComplete = 100, PercentSuccess = 0, ParentQueueId = 1)
+        cls.parent = WQE(); cls.parent.id = 1
+        cls.available = WQE(Status = 'Available', ParentQueueId = 1)
+        cls.acquired = WQE(Status = 'Acquired', ParentQueueId = 1)
+        cls.negotiating = WQE(Status = 'Negotiating', ParentQueueId = 1)
+        cls.done = WQE(Status = 'Done', PercentComplete = 100, PercentSuccess = 100, ParentQueueId = 1)
+        cls.failed = WQE(Status = 'Failed', PercentComplete = 100, PercentSuccess = 0, ParentQueueId = 1)
 
     def tearDown(self):
         pass
@@ -109,6 +109,173 @@ class WorkQueueBackendTest(unittest.TestCase):
         self.assertEqual(len(self.backend.db.allDocs()['rows']), 4)  # design doc + workflow + 2 elements
         self.assertEqual(self.backend.db.loadView('WorkQueue', 'conflicts')['total_rows'], 0)
 
+    def testGetElementsForWorkflows(self):
+        """Get the elements of several workflows at once"""
+        elements = []
+        for wf in ('backend_test_1', 'backend_test_2', 'backend_test_3'):
+            elements.append(WorkQueueElement(RequestName=wf,
+                                             WMSpec=self.processingSpec,
+                                             Status='Available',
+                                             SiteWhitelist=["place"],
+                                             Jobs=10, Priority=1))
+        self.backend.insertElements(elements)
+
+        self.assertEqual(len(self.backend.getElements(WorkflowName='backend_test_1')), 1)
+        work = self.backend.getElements(WorkflowName=['backend_test_1', 'backend_test_3'])
+        self.assertItemsEqual([x['RequestName'] for x in work], ['backend_test_1', 'backend_test_3'])
+        work = self.backend.getElements(WorkflowName=set(['backend_test_2']), status='Available')
+        self.assertEqual([x['RequestName'] for x in work], ['backend_test_2'])
+
+    def testGetElementsForManyLongWorkflowNames(self):
+        """A full batch of long workflow names doesn't end up in the request url"""
+        names = ['backend_test_%s_%03d' % ('x' * 200, i) for i in range(100)]
+        elements = []
+        for wf in names[:3]:
+            elements.append(WorkQueueElement(RequestName=wf,
+                                             WMSpec=self.processingSpec,
+                                             Status='Available',
+                                             SiteWhitelist=["place"],
+                                             Jobs=10, Priority=1))
+        self.backend.insertElements(elements)
+
+        work = self.backend.getElements(WorkflowName=names)
+        self.assertItemsEqual([x['RequestName'] for x in work], names[:3])
+        work = self.backend.getElements(WorkflowName=names, status='Available')
+        self.assertItemsEqual([x['RequestName'] for x in work], names[:3])
+        self.assertEqual(self.backend.getInboxElements(WorkflowName=names), [])
+
+    def testGetElementsForParents(self):
+        """Get the elements of several parents at once"""
+        parents = []
+        for wf in ('backend_test_1', 'backend_test_2'):
+            parents.append(CouchWorkQueueElement(self.backend.inbox,
+                                                 elementParams={'RequestName': wf,
+                                                                'WMSpec': self.processingSpec,
+                                                                'TeamName': 'team',
+                                                                'WMBSUrl': None}))
+        element1 = WorkQueueElement(RequestName='backend_test_1', WMSpec=self.processingSpec,
+                                    Status='Available', Jobs=10, Priority=1)
+        element2 = WorkQueueElement(RequestName='backend_test_1', WMSpec=self.processingSpec,
+                                    Status='Available', Jobs=20, Priority=1)
+        self.backend.insertElements([element1, element2], parent=parents[0])
+
+        children = self.backend.getElementsForParents(*parents)
+        self.assertEqual(sorted(children), sorted(x.id for x in parents))
+        self.assertEqual(sorted(x['Jobs'] for x in children[parents[0].id]), [10, 20])
+        self.assertEqual(children[parents[1].id], [])
+        self.assertEqual(self.backend.getElementsForParents(), {})
+
+    def testIterInboxElements(self):
+        """Iterate over the matching inbox elements in batches"""
+        for wf in ('backend_test_1', 'backend_test_2', 'backend_test_3'):
+            element = CouchWorkQueueElement(self.backend.inbox,
+                                            elementParams={'RequestName': wf,
+                                                           'WMSpec': self.processingSpec,
+                                                           'OpenForNewData': wf != 'backend_test_2'})
+            element.save()
+        self.backend.inbox.commit()
+
+        work = list(self.backend.iterInboxElements(batchSize=1, OpenForNewData=True))
+        self.assertItemsEqual([x['RequestName'] for x in work], ['backend_test_1', 'backend_test_3'])
+        self.assertEqual(len(list(self.backend.iterInboxElements(batchSize=2))), 3)
+        self.assertEqual(list(self.backend.iterInboxElements(RequestName='nonExistingWorkflow')), [])
+
+    def testIterInboxElementsById(self):
+        """Load inbox elements by id, skipping the missing ones"""
+        elementIDs = []
+        for wf in ('backend_test_1', 'backend_test_2'):
+            element = CouchWorkQueueElement(self.backend.inbox,
+                                            elementParams={'RequestName': wf,
+                                                           'WMSpec': self.processingSpec})
+            element.save()
+            elementIDs.append(element.id)
+        self.backend.inbox.commit()
+
+        work = list(self.backend.iterInboxElementsById([elementIDs[0], 'nonExistingElement', elementIDs[1]],
+                                                       batchSize=2))
+        self.assertEqual([x.id for x in work], elementIDs)
+        self.assertEqual([x['RequestName'] for x in work], ['backend_test_1', 'backend_test_2'])
+        self.assertEqual(list(self.backend.iterInboxElementsById(['nonExistingElement'])), [])
+        self.assertEqual(list(self.backend.iterInboxElementsById([])), [])
+
+    def testLoadElements(self):
+        """Reload several elements at once"""
+        elements = []
+        for wf in ('backend_test_1', 'backend_test_2'):
+            elements.append(WorkQueueElement(RequestName=wf,
+                                             WMSpec=self.processingSpec,
+                                             Status='Available',
+                                             SiteWhitelist=["place"],
+                                             Jobs=10, Priority=1))
+        self.backend.insertElements(elements)
+        work = self.backend.getElements()
+        self.assertEqual(len(work), 2)
+
+        self.backend.updateElements(*[x.id for x in work], Status='Running')
+        self.assertEqual([x['Status'] for x in work], ['Available', 'Available'])
+        self.assertEqual(self.backend.loadElements(*work), work)
+        self.assertEqual([x['Status'] for x in work], ['Running', 'Running'])
+        self.assertEqual(self.backend.loadElements(), [])
+
+    def testGetWMSpecs(self):
+        """Load several specs at once"""
+        element = WorkQueueElement(RequestName='backend_test',
+                                   WMSpec=self.processingSpec,
+                                   Status='Available',
+                                   SiteWhitelist=["place"],
+                                   Jobs=10, Priority=1)
+        self.backend.insertElements([element])
+        specs = self.backend.getWMSpecs(['testProcessing', 'nonExistingSpec'])
+        self.assertEqual(list(specs), ['testProcessing'])
+        self.assertEqual(specs['testProcessing'].name(), self.backend.getWMSpec('testProcessing').name())
+        self.assertEqual(self.backend.getWMSpecs([]), {})
+
+    def testGetWMSpecsAttachments(self):
+        """Several specs go through the attachment round trip unchanged"""
+        otherSpec = rerecoWorkload('testProcessingOther', rerecoArgs)
+        otherSpec.setPriority(12345)
+        elements = []
+        for spec in (self.processingSpec, otherSpec):
+            elements.append(WorkQueueElement(RequestName=spec.name(),
+                                             WMSpec=spec,
+                                             Status='Available',
+                                             SiteWhitelist=["place"],
+                                             Jobs=10, Priority=1))
+        self.backend.insertElements(elements)
+
+        specs = self.backend.getWMSpecs(['testProcessing', 'testProcessingOther'])
+        self.assertItemsEqual(list(specs), ['testProcessing', 'testProcessingOther'])
+        for spec in (self.processingSpec, otherSpec):
+            loaded = specs[spec.name()]
+            self.assertEqual(loaded.name(), spec.name())
+            self.assertEqual(loaded.priority(), spec.priority())
+            self.assertEqual(loaded.startPolicy(), spec.startPolicy())
+            self.assertEqual(loaded.listAllTaskPathNames(), spec.listAllTaskPathNames())
+            self.assertEqual(loaded.listAllTaskPathNames(),
+                             self.backend.getWMSpec(spec.name()).listAllTaskPathNames())
+        self.assertEqual(specs['testProcessingOther'].priority(), 12345)
+
+    def testUpdateAndSaveElements(self):
+        """Elements changed concurrently are reloaded and saved again"""
+        elements = []
+        for wf in ('backend_test_1', 'backend_test_2'):
+            elements.append(WorkQueueElement(RequestName=wf,
+                                             WMSpec=self.processingSpec,
+                                             Status='Available',
+                                             SiteWhitelist=["place"],
+                                             Jobs=10, Priority=1))
+        self.backend.insertElements(elements)
+        work = self.backend.getElements()
+        # change one of them behind our back, saving it as is would be a conflict
+        self.backend.updateElements(work[0].id, Priority=5)
+
+        saved = self.backend.updateAndSaveElements(*work, Status='CancelRequested')
+        self.assertEqual(len(saved), 2)
+        work = self.backend.getElements()
+        self.assertEqual([x['Status'] for x in work], ['CancelRequested', 'CancelRequested'])
+        self.assertEqual(sorted(x['Priority'] for x in work), [1, 5])
+        self.assertEqual(self.backend.updateAndSaveElements(Status='Canceled'), [])
+
 
 if __name__ == '__main__':
     unittest.main()
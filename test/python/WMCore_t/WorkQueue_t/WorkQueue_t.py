@@ -964,8 +964,8 @@ class WorkQueueTest(WorkQueueTestCase):
         # local cancelded
         print(self.localQueue.status())
         # self.assertEqual(len(self.localQueue.status(status='Canceled')), 1)
-        # clear global
-        self.globalQueue.deleteWorkflows(processingSpec.name())
+        # clear global, workflows already gone are skipped
+        self.globalQueue.deleteWorkflows(processingSpec.name(), 'nonExistingWorkflow')
         self.assertEqual(len(self.globalQueue.statusInbox()), 0)
 
         ### check cancel of work negotiating in agent works
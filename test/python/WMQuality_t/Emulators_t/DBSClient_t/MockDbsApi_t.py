@@ -6,6 +6,7 @@ import unittest
 
 from dbs.apis.dbsClient import DbsApi
 
+from RestClient.ErrorHandling.RestClientExceptions import HTTPError
 from Utils.ExtendedUnitTestCase import ExtendedUnitTestCase
 from WMQuality.Emulators.DBSClient.MockDbsApi import MockDbsApi
 
@@ -13,6 +14,12 @@ from WMQuality.Emulators.DBSClient.MockDbsApi import MockDbsApi
 DATASET = '/HighPileUp/Run2011A-v1/RAW'
 BLOCK = '/HighPileUp/Run2011A-v1/RAW#fabf118a-cbbf-11e0-80a9-003048caaace'
 FILE_NAMES = [u'/store/data/Commissioning2015/Cosmics/RAW/v1/000/238/545/00000/C47FDF25-2ECF-E411-A8E2-02163E011839.root']
+# files stored one by one in the mock data
+MOCK_FILE_NAMES = [u'/store/data/ComissioningHI/Cosmics/RAW/v1/000/180/841/721E482F-A407-E111-8C0C-BCAEC518FF6E.root',
+                   u'/store/data/ComissioningHI/Cosmics/RAW/v1/000/180/851/F8129BC8-A107-E111-9896-BCAEC532970A.root',
+                   u'/store/data/ComissioningHI/Cosmics/RAW/v1/000/180/852/C0A3D337-1408-E111-836F-0030486780A8.root']
+# file for which the mock raises an HTTPError
+FAILING_FILE_NAME = u'ParentFixDummyb1e9ac24-921c-11e3-a952-002219915e5d'
 
 
 class MockDbsApiTest(ExtendedUnitTestCase):
@@ -65,5 +72,48 @@ class MockDbsApiTest(ExtendedUnitTestCase):
         return
 
 
+class MockDbsApiOfflineTest(ExtendedUnitTestCase):
+    """
+    Tests of the mock itself, which don't need the real DBS
+    """
+
+    def setUp(self):
+        self.endpoint = 'https://cmsweb.cern.ch/dbs/prod/global/DBSReader'
+        self.mockDBS = MockDbsApi(self.endpoint)
+        return
+
+    def testUninitializedInstance(self):
+        """
+        An instance whose __init__ didn't run has no lookup methods, nor attributes
+        """
+        mockDBS = MockDbsApi.__new__(MockDbsApi)
+        self.assertRaises(AttributeError, getattr, mockDBS, 'listSomething')
+        self.assertRaises(AttributeError, getattr, mockDBS, '_lookups')
+        self.assertFalse(hasattr(self.mockDBS, '__setstate__'))
+        self.assertTrue(callable(self.mockDBS.listSomething))
+        return
+
+    def testMultipleFileNames(self):
+        """
+        Lookups of several files give the concatenated results of the single file lookups
+        """
+        for (member, kwargs) in [('listFileArray', {}), ('listFileArray', {'detail': True}),
+                                 ('listFileLumiArray', {})]:
+            method = getattr(self.mockDBS, member)
+            expected = []
+            for lfn in MOCK_FILE_NAMES:
+                result = method(logical_file_name=[lfn], **kwargs)
+                self.assertTrue(result)
+                expected.extend(result)
+            self.assertEqual(method(logical_file_name=MOCK_FILE_NAMES, **kwargs), expected)
+            self.assertEqual(method(logical_file_name=list(reversed(MOCK_FILE_NAMES)), **kwargs),
+                             [row for lfn in reversed(MOCK_FILE_NAMES)
+                              for row in method(logical_file_name=[lfn], **kwargs)])
+
+            self.assertRaises(KeyError, method, logical_file_name=MOCK_FILE_NAMES + ['/store/unknown.root'], **kwargs)
+            self.assertRaises(HTTPError, method, logical_file_name=MOCK_FILE_NAMES + [FAILING_FILE_NAME], **kwargs)
+        return
+
+
 if __name__ == '__main__':
     unittest.main()